@@ -1,21 +1,19 @@
 #!/bin/bash
 set -e
 
-# setup ssh: allow key to be used without a prompt and start ssh agent
-export GIT_SSH_COMMAND="ssh -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
-eval "$(ssh-agent -s)"
-
 ######## Run notebook/word converter ########
-# word converter using pandoc
-/fastpages/word2post.sh
-# notebook converter using nbdev
-cp /fastpages/settings.ini .
-python /fastpages/nb2post.py
+# Word documents (pandoc) and notebooks (nbdev) convert at once on a shared pool,
+# then orphaned assets are removed and the search index for assets/js/search.js is built
+python /fastpages/build.py
 
 
 ######## Optionally save files and build GitHub Pages ########
 if [[ "$INPUT_BOOL_SAVE_MARKDOWN" == "true" ]];then
 
+    # setup ssh: allow key to be used without a prompt and start ssh agent
+    export GIT_SSH_COMMAND="ssh -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
+    eval "$(ssh-agent -s)"
+
     if [ -z "$INPUT_SSH_DEPLOY_KEY" ];then 
         echo "You must set the SSH_DEPLOY_KEY input if BOOL_SAVE_MARKDOWN is set to true."; 
         exit 1;
@@ -0,0 +1,116 @@
+"""Which assets each notebook and Word document references or produces, for targeted rebuilds and orphan collection"""
+import os, re, json, argparse, threading
+from pathlib import Path
+from typing import Dict, Iterable, List
+from manifest import CACHE_DIR, write_atomic
+from fast_template import SOURCES
+from nbstream import iter_notebook
+
+# Directories only the converters write to: files there that no source produces are orphans
+MANAGED = ('images/copied_from_nb', 'assets/img')
+# Where the site can mention an asset by path
+SITE_TEXT = ('_posts', '_pages', '_includes', '_layouts', '_data')
+_re_md_image = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)')
+_re_html_src = re.compile(r'<img[^>]*\ssrc\s*=\s*["\']([^"\']+)["\']', re.I)
+_re_site_url = re.compile(r'^(?:{{\s*site\.(?:url|baseurl)\s*}})*/?')
+
+def _local(ref: str) -> bool: return not re.match(r'^(?:[a-z]+:|//|#|data:)', ref, re.I)
+
+def referenced_assets(nb_path: Path, root: Path=Path('.')) -> List[Path]:
+    "Existing files the markdown cells of `nb_path` point to, relative to the notebook or to the site `root`."
+    refs = set()
+    # Read a cell at a time, a notebook's outputs can be far bigger than its markdown
+    for k, cell in iter_notebook(nb_path):
+        if k != 'cell' or cell.get('cell_type') != 'markdown': continue
+        src = cell.source
+        for ref in _re_md_image.findall(src) + _re_html_src.findall(src):
+            if not _local(ref): continue
+            ref = ref.split('?')[0].split('#')[0]
+            site_ref = _re_site_url.sub('', ref)
+            for p in (Path(nb_path).parent/ref, Path(root)/site_ref):
+                if p.is_file():
+                    refs.add(Path(os.path.relpath(p, root)))
+                    break
+    return sorted(refs)
+
+class AssetIndex:
+    """
+    Site-wide JSON map from each source to the assets it references and the files its conversion produced,
+    with paths relative to the site root.
+
+    Converters `update` it after each conversion. `users` finds the sources to rebuild when an asset changes
+    and `collect` deletes what sources that no longer exist produced, and files in the `MANAGED` directories
+    that no source produces nor any page mentions.
+    """
+    def __init__(self, path: Path=None, root: Path=Path('.')):
+        self.path,self.root = (Path(path) if path else None),Path(root)
+        self.entries: Dict[str, dict] = {}
+        # build.py updates the index from the notebook and Word pipelines at once
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            try: self.entries = json.loads(self.path.read_text())
+            except ValueError: pass
+
+    def _rel(self, p) -> str: return os.path.relpath(Path(p).absolute(), self.root.absolute())
+
+    def update(self, src: Path, referenced: Iterable[Path], produced: Iterable[Path], **extra):
+        entry = dict(referenced=sorted(self._rel(self.root/p) for p in referenced),
+                     produced=sorted(self._rel(p) for p in produced), **extra)
+        with self._lock: self.entries[self._rel(src)] = entry
+
+    def get(self, src: Path) -> dict: return self.entries.get(self._rel(src), {})
+
+    def users(self, asset: Path) -> List[str]:
+        "Sources referencing `asset`, which need a rebuild when it changes."
+        a = self._rel(asset)
+        return sorted(s for s, e in self.entries.items() if a in e['referenced'])
+
+    def orphans(self) -> List[Path]:
+        "Files produced by sources that no longer exist, or in `MANAGED` but neither produced nor mentioned."
+        live = {s: e for s, e in self.entries.items() if (self.root/s).exists()}
+        produced = {p for e in live.values() for p in e['produced']}
+        referenced = {p for e in live.values() for p in e['referenced']}
+        candidates = {p for s, e in self.entries.items() if s not in live for p in e['produced']}
+        sources = {self._rel(p) for d, pattern, skip_private in SOURCES for p in (self.root/d).glob(pattern)
+                   if not (skip_private and p.name.startswith('_'))}
+        # Until every source was indexed once, files of the managed directories may belong to a missing one
+        for d in (MANAGED if sources <= set(live) else ()):
+            candidates |= {self._rel(f) for f in (self.root/d).rglob('*') if f.is_file() and f.name != 'README.md'}
+        candidates -= produced | referenced
+        text = '\n'.join(f.read_text(encoding='utf-8', errors='ignore') for d in SITE_TEXT
+                         for f in (self.root/d).rglob('*') if f.is_file() and self._rel(f) not in candidates)
+        # Pages mention converted assets by URL, and nbdev's copies relative to their managed directory
+        tail = lambda p: next((p[len(d)+1:] for d in MANAGED if p.startswith(d + '/')), p)
+        return sorted(self.root/p for p in candidates if (self.root/p).exists() and tail(p) not in text)
+
+    def collect(self, dry_run: bool=False) -> List[Path]:
+        "Delete the `orphans` and forget the sources that no longer exist, returning what was (or would be) deleted."
+        orphans = self.orphans()
+        if dry_run: return orphans
+        for f in orphans:
+            f.unlink()
+            # Drop the directories this emptied, e.g. the media folder of a deleted Word document
+            d = f.parent
+            while d != self.root and d.exists() and not any(d.iterdir()):
+                d.rmdir()
+                d = d.parent
+        self.entries = {s: e for s, e in self.entries.items() if (self.root/s).exists()}
+        self.save()
+        return orphans
+
+    def save(self):
+        if self.path is None: return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock: write_atomic(self.path, json.dumps(self.entries, indent=1, sort_keys=True))
+
+index = AssetIndex(CACHE_DIR/'assets.json')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', nargs='+', metavar='ASSET', help='print the sources referencing these assets')
+    parser.add_argument('--dry-run', action='store_true', help='only list the orphaned files')
+    args = parser.parse_args()
+    if args.users:
+        for a in args.users: print(f"{a}: {', '.join(index.users(Path(a))) or 'no source'}")
+    else:
+        for f in index.collect(dry_run=args.dry_run): print(f"{'orphaned' if args.dry_run else 'removed'}: {f}")
@@ -0,0 +1,97 @@
+"""Offline throughput benchmark of the notebook to post conversion in nb2post.py"""
+import os, sys, json, time, base64, random, shutil, argparse, tempfile, platform, resource
+from pathlib import Path
+import nbformat
+
+HERE = Path(__file__).absolute().parent
+_flags = ['collapse_show', 'collapse_hide', 'hide_input', 'hide_output']
+
+def synthetic_nb(i: int, n_cells: int=50, output_kb: int=4, image_every: int=10, image_kb: int=30,
+                 flag_every: int=5, seed: int=0) -> nbformat.NotebookNode:
+    """
+    Notebook with a fastpages front matter cell followed by `n_cells` code cells with `output_kb` KB of stdout.
+    Every `image_every` cells get a `image_kb` KB image output, every `flag_every` cells one of the
+    `collapse`/`hide` flags of hide.tpl in turn.
+    """
+    rnd = random.Random(seed*100_003 + i)
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell(
+        f'# Synthetic post {i}\n> Generated to benchmark the conversion\n\n- toc: false\n- categories: [benchmark]'))
+    line = 'loss: 0.1234 - accuracy: 0.9876 - val_loss: 0.2345 - val_accuracy: 0.8765\n'
+    for c in range(n_cells):
+        cell = nbformat.v4.new_code_cell(f'x_{c} = [i ** 2 for i in range({c})]\nprint(sum(x_{c}))', execution_count=c+1)
+        cell.outputs.append(nbformat.v4.new_output('stream', name='stdout', text=line*(output_kb*1024//len(line))))
+        if image_every and c % image_every == 0:
+            png = base64.b64encode(bytes(rnd.getrandbits(8) for _ in range(image_kb*1024))).decode()
+            cell.outputs.append(nbformat.v4.new_output('display_data', data={'image/png': png, 'text/plain': '<Figure>'}))
+        if flag_every and c % flag_every == 0: cell.metadata[_flags[(c//flag_every) % len(_flags)]] = True
+        nb.cells.append(cell)
+        if c % 7 == 0: nb.cells.append(nbformat.v4.new_markdown_cell(f'## Section {c}\nSome *markdown* text.'))
+    return nb
+
+def _peak_rss_mb() -> float:
+    div = 2**20 if sys.platform == 'darwin' else 2**10
+    return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / div
+
+def run(n_notebooks: int=20, n_workers: int=1, repeats: int=1, **nb_kwargs) -> dict:
+    "Convert freshly generated notebooks in a scratch workspace and return the throughput figures."
+    import nb2post
+    ws = Path(tempfile.mkdtemp(prefix='fastpages-bench-'))
+    cwd = os.getcwd()
+    try:
+        shutil.copy(HERE/'settings.ini', ws/'settings.ini')
+        (ws/'_notebooks').mkdir()
+        (ws/'_posts').mkdir()
+        for i in range(n_notebooks):
+            nbformat.write(synthetic_nb(i, **nb_kwargs), str(ws/'_notebooks'/f'2020-01-01-bench-{i}.ipynb'))
+        os.chdir(ws)
+        nbs = sorted(Path('_notebooks').glob('*.ipynb'))
+        size_mb = sum(nb.stat().st_size for nb in nbs) / 2**20
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ok = [ok for _, ok in nb2post.convert_many(nbs, dest='_posts/', template_file=HERE/'fastpages.tpl',
+                                                       n_workers=n_workers)]
+            times.append(time.perf_counter() - start)
+            assert all(ok), 'some synthetic notebooks failed to convert'
+        best = min(times)
+        return dict(notebooks=n_notebooks, workers=n_workers, input_mb=round(size_mb, 3), times_s=times,
+                    notebooks_per_s=round(n_notebooks/best, 3), mb_per_s=round(size_mb/best, 3),
+                    peak_rss_mb=round(_peak_rss_mb(), 1), params=nb_kwargs,
+                    python=platform.python_version(), machine=platform.machine(), cpus=os.cpu_count())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(ws, ignore_errors=True)
+
+def compare(result: dict, baseline: dict, threshold: float=0.1) -> list:
+    "Metrics of `result` that regressed by more than `threshold` (a fraction) against `baseline`."
+    regressions = []
+    for k in ('notebooks_per_s', 'mb_per_s'):
+        if result[k] < baseline[k] * (1 - threshold): regressions.append(f'{k}: {baseline[k]} -> {result[k]}')
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + threshold):
+        regressions.append(f"peak_rss_mb: {baseline['peak_rss_mb']} -> {result['peak_rss_mb']}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--notebooks', type=int, default=20)
+    parser.add_argument('--cells', type=int, default=50, help='code cells per notebook')
+    parser.add_argument('--output-kb', type=int, default=4, help='stdout KB per code cell')
+    parser.add_argument('--image-every', type=int, default=10, help='add an image output every N cells, 0 for none')
+    parser.add_argument('--image-kb', type=int, default=30)
+    parser.add_argument('--flag-every', type=int, default=5, help='set a collapse/hide flag every N cells, 0 for none')
+    parser.add_argument('--workers', type=int, default=1, help='conversion processes, 0 for one per core')
+    parser.add_argument('--repeats', type=int, default=3, help='the best of the repeats is reported')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative regression, 0.1 is 10%%')
+    args = parser.parse_args()
+    result = run(args.notebooks, n_workers=args.workers, repeats=args.repeats, n_cells=args.cells,
+                 output_kb=args.output_kb, image_every=args.image_every, image_kb=args.image_kb,
+                 flag_every=args.flag_every)
+    print(f"{result['notebooks_per_s']} notebooks/s, {result['mb_per_s']} MB/s, peak RSS {result['peak_rss_mb']} MB")
+    if args.output: Path(args.output).write_text(json.dumps(result, indent=1))
+    if args.compare:
+        regressions = compare(result, json.loads(Path(args.compare).read_text()), args.threshold)
+        for r in regressions: print(f'REGRESSION {r}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,64 @@
+"""Converts the Word documents and notebooks of the site concurrently, then collects orphaned assets and builds the search index and post pages"""
+import os, sys, time, shutil, argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from fast_template import registry
+from asset_index import index
+import word2post
+
+HERE = Path(__file__).absolute().parent
+
+def build(workspace: Path, n_workers: int=0, stream_above: int=20 * 2**20) -> bool:
+    """
+    Run the Word and notebook conversions of `workspace` at once on a single pool of `n_workers` processes
+    (one per core if 0), then the steps that need every post. Notebooks over `stream_above` bytes are converted a
+    cell at a time. Print a summary and return whether all of it worked.
+    """
+    start,workspace = time.monotonic(),Path(workspace).absolute()
+    os.chdir(workspace)
+    docs = sorted(Path('_word').glob('*.docx'))
+    nbs = [p for p in sorted(Path('_notebooks').glob('*.ipynb')) if not p.name.startswith('_')]
+    # fail before converting anything if a notebook and a Word document would overwrite each other
+    registry.register_site()
+    if nbs:
+        # the action image ships its own settings.ini, a checkout of the repo runs with the one it has
+        if HERE != workspace/'_action_files': shutil.copy(HERE/'settings.ini', 'settings.ini')
+        # nbdev and nbconvert take seconds to import, only pay for them when there is a notebook. Before the pool
+        # forks: a worker forked while another thread holds an import lock waits on it forever
+        import nb2post
+    status = {}
+    with ProcessPoolExecutor(n_workers or None) as pool, ThreadPoolExecutor(2) as threads:
+        # Fork every worker now, from this thread alone, not while a pipeline thread is in the middle of an import
+        pool.submit(int).result()
+        pipelines = {}
+        if docs: pipelines['Word documents'] = threads.submit(word2post.word2post, workspace, executor=pool)
+        if nbs: pipelines['notebooks'] = threads.submit(nb2post.nb2post, incremental=True, executor=pool,
+                                                        stream_above=stream_above)
+        for name, fut in pipelines.items():
+            try: status[name] = fut.result()
+            except Exception as e:
+                print(f'{name}: {e}')
+                status[name] = False
+    # remove the images and posts no source produces or references anymore
+    removed = index.collect()
+    for f in removed: print(f'removed: {f}')
+    # prebuilt search index for assets/js/search.js
+    import search_index
+    search_index.search_index()
+    # category, tag and archive pages and feed.json, so Liquid doesn't loop over site.posts
+    import post_index
+    post_index.post_index()
+
+    print(f"=== {len(docs)} Word documents, {len(nbs)} notebooks, {len(removed)} orphaned assets removed "
+          f"in {time.monotonic() - start:.1f}s ===")
+    for name, ok in status.items(): print(f"{name}: {'ok' if ok else 'FAILED'}")
+    return all(status.values())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workspace', default=os.environ.get('GITHUB_WORKSPACE', '.'))
+    parser.add_argument('--workers', type=int, default=0, help='conversion processes shared by both pipelines, 0 for one per core')
+    parser.add_argument('--stream-above', type=float, default=20, metavar='MB',
+                        help='convert notebooks larger than this a cell at a time, bounding memory by the largest cell')
+    args = parser.parse_args()
+    sys.exit(0 if build(Path(args.workspace), n_workers=args.workers, stream_above=int(args.stream_above * 2**20)) else 1)
@@ -0,0 +1,114 @@
+"""Executes notebooks ahead of conversion, reusing the cached outputs of cells that did not change"""
+import json, time, hashlib, argparse
+from pathlib import Path
+import nbformat
+from manifest import CACHE_DIR
+
+def cell_hashes(nb: nbformat.NotebookNode) -> dict:
+    "Index -> hash of every code cell, chained with the hashes of the code cells above it."
+    h,hashes = '',{}
+    for i, cell in enumerate(nb.cells):
+        if cell.cell_type != 'code': continue
+        h = hashlib.sha256((h + cell.source).encode()).hexdigest()
+        hashes[i] = h
+    return hashes
+
+class CellCache:
+    """
+    Outputs of the code cells of one notebook, keyed by their chained hash, under `CACHE_DIR/execute`.
+
+    Cells that took at least `checkpoint_after` seconds also get a `dill` session checkpoint, so a later run
+    resumes from the last checkpoint before the first changed cell instead of replaying everything above it.
+    """
+    def __init__(self, nb_path: Path, cache_dir: Path=None):
+        self.dir = Path(cache_dir or CACHE_DIR)/'execute'/Path(nb_path).stem
+        self.path = self.dir/'cells.json'
+        try: self.cells = json.loads(self.path.read_text()) if self.path.exists() else {}
+        except ValueError: self.cells = {}
+
+    def checkpoint(self, h: str) -> Path: return (self.dir/f'{h}.pkl').absolute()
+
+    def save(self, hashes: set):
+        "Keep only the cells (and checkpoints) of the current version of the notebook."
+        self.cells = {h: c for h, c in self.cells.items() if h in hashes}
+        self.dir.mkdir(parents=True, exist_ok=True)
+        for ckpt in self.dir.glob('*.pkl'):
+            if ckpt.stem not in hashes: ckpt.unlink()
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.cells))
+        tmp.replace(self.path)
+
+def _run(client, code: str, index: int, check: bool=False) -> bool:
+    "Run `code` in the kernel of `client` without touching the notebook, whether it succeeded."
+    from nbclient.exceptions import CellExecutionError
+    # nbclient stores the cell it executes at `index` in the notebook, put the real one back
+    cell = client.nb.cells[index]
+    try: client.execute_cell(nbformat.v4.new_code_cell(code), index, store_history=False)
+    except CellExecutionError:
+        if check: raise
+        return False
+    finally: client.nb.cells[index] = cell
+    return True
+
+def execute(nb_path: Path, force: bool=False, checkpoint_after: float=10., timeout: int=None,
+            kernel_name: str=None, cache_dir: Path=None) -> int:
+    """
+    Execute the code cells of `nb_path` from the first one whose chained hash is not cached, write the
+    cached and fresh outputs back to the notebook and return how many cells ran.
+
+    Only cell sources are hashed: use `force` when the data a notebook reads changed.
+    """
+    nb_path = Path(nb_path)
+    nb = nbformat.read(str(nb_path), as_version=4)
+    cache = CellCache(nb_path, cache_dir)
+    hashes = cell_hashes(nb)
+    todo = list(hashes) if force else [i for i in hashes if hashes[i] not in cache.cells]
+    first = todo[0] if todo else len(nb.cells)
+    done = [i for i in hashes if i < first]
+    if todo: _execute(nb, nb_path, hashes, first, done, cache, checkpoint_after, timeout, kernel_name)
+    changed = bool(todo)
+    for i in done:
+        cell,cached = nb.cells[i],cache.cells[hashes[i]]
+        outputs = [nbformat.from_dict(o) for o in cached['outputs']]
+        if cell.outputs != outputs or cell.execution_count != cached['execution_count']: changed = True
+        cell.outputs,cell.execution_count = outputs,cached['execution_count']
+    if changed: nbformat.write(nb, str(nb_path))
+    print(f'{nb_path.name}: executed {len(todo)} of {len(hashes)} code cells')
+    return len(todo)
+
+def _execute(nb, nb_path, hashes, first, done, cache, checkpoint_after, timeout, kernel_name):
+    "Run the code cells from `first` on, after restoring the kernel state the cached cells in `done` left."
+    from nbclient import NotebookClient
+    client = NotebookClient(nb, timeout=timeout, kernel_name=kernel_name or nb.metadata.get('kernelspec', {}).get('name', 'python3'),
+                            resources=dict(metadata=dict(path=str(nb_path.parent))))
+    with client.setup_kernel():
+        # Load the last checkpoint above `first`, then replay the cached cells after it
+        start = next((i for i in reversed(done) if cache.checkpoint(hashes[i]).exists()), None)
+        if start is not None and not _run(client, f'import dill; dill.load_session({str(cache.checkpoint(hashes[start]))!r})', start):
+            start = None
+        replay = [i for i in done if start is None or i > start]
+        if replay: print(f'{nb_path.name}: replaying {len(replay)} cached cells' + (f' after checkpoint {start}' if start is not None else ''))
+        for i in replay: _run(client, nb.cells[i].source, i, check=True)
+        for i in [i for i in hashes if i >= first]:
+            began = time.perf_counter()
+            client.execute_cell(nb.cells[i], i)
+            # Number the cells as a single top to bottom run would, whatever was replayed or restored
+            nb.cells[i].execution_count = 1 + max([0] + [nb.cells[j].execution_count or 0 for j in hashes if j < i])
+            cache.cells[hashes[i]] = dict(outputs=nb.cells[i].outputs, execution_count=nb.cells[i].execution_count)
+            if time.perf_counter() - began >= checkpoint_after:
+                _run(client, f'import dill; dill.dump_session({str(cache.checkpoint(hashes[i]))!r})', i)
+            # Persist as we go, a failing cell keeps the work done above it
+            cache.save(set(hashes.values()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('notebooks', nargs='*', help='notebooks to execute, all of _notebooks by default')
+    parser.add_argument('--force', action='store_true', help='execute every cell, ignoring the cache')
+    parser.add_argument('--checkpoint-after', type=float, default=10.,
+                        help='save the kernel state with dill after cells running at least this many seconds')
+    parser.add_argument('--timeout', type=int, default=None, help='seconds allowed per cell, unlimited by default')
+    parser.add_argument('--kernel', default=None, help="kernel to use instead of the notebook's own")
+    args = parser.parse_args()
+    for nb in args.notebooks or sorted(Path('_notebooks').glob('*.ipynb')):
+        execute(Path(nb), force=args.force, checkpoint_after=args.checkpoint_after, timeout=args.timeout,
+                kernel_name=args.kernel)
@@ -1,13 +1,16 @@
 from datetime import datetime
-import re, os
+import re, os, json, threading
 from pathlib import Path
-from typing import Tuple, Set
+from typing import Dict, Optional, Tuple, Set
+from manifest import CACHE_DIR, write_atomic
+from profiling import profiler
 
 # Check for YYYY-MM-DD
 _re_blog_date = re.compile(r'([12]\d{3}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])-)')
 # Check for leading dashses or numbers
 _re_numdash = re.compile(r'(^[-\d]+)')
 
+@profiler.timed('rename_for_jekyll')
 def rename_for_jekyll(nb_path: Path, warnings: Set[Tuple[str, str]]=None) -> str:
     """
     Return a Path's filename string appended with its modified time in YYYY-MM-DD format.
@@ -25,5 +28,60 @@ def rename_for_jekyll(nb_path: Path, warnings: Set[Tuple[str, str]]=None) -> str
         dtnm = datetime.fromtimestamp(mdate).strftime("%Y-%m-%d-") + clean_name
         assert _re_blog_date.match(dtnm), f'{dtnm} is not a valid name, filename must be pre-pended with YYYY-MM-DD-'
         # push this into a set b/c _nb2htmlfname gets called multiple times per conversion
-        if warnings: warnings.add((nb_path, dtnm))
+        if warnings is not None: warnings.add((nb_path, dtnm))
         return dtnm
+
+# Sources that become posts, and whether names starting with '_' are skipped for them
+SOURCES = (('_notebooks', '*.ipynb', True), ('_word', '*.docx', False))
+
+class PostRegistry:
+    """
+    Site-wide map from source files to their post names in `_posts`, shared by nb2post.py and word2post.py.
+
+    Each name is computed once per source path and modification time, and kept in the JSON file at `path`
+    between runs. Two sources claiming the same post name is an error instead of a silent overwrite.
+    """
+    def __init__(self, path: Optional[Path]=None):
+        self.path = Path(path) if path else None
+        self._cache: Dict[str, list] = {}
+        if self.path and self.path.exists():
+            try: self._cache = json.loads(self.path.read_text())
+            except ValueError: pass
+        self._owners: Dict[str, str] = {}
+        # build.py names posts from the notebook and Word pipelines at once
+        self._lock = threading.RLock()
+
+    def name(self, src: Path, warnings: Set[Tuple[str, str]]=None) -> str:
+        "Post name of `src`, as `rename_for_jekyll` would return it."
+        with self._lock: return self._name(src, warnings)
+
+    def _name(self, src: Path, warnings: Set[Tuple[str, str]]=None) -> str:
+        src = Path(src)
+        assert src.exists(), f'{src} could not be found.'
+        key, mtime = str(src.absolute()), os.path.getmtime(src)
+        cached = self._cache.get(key)
+        if cached and cached[0] == mtime:
+            name, renamed = cached[1], cached[2]
+            if renamed and warnings is not None: warnings.add((src, name))
+        else:
+            name = rename_for_jekyll(src)
+            renamed = not _re_blog_date.match(src.name)
+            if renamed and warnings is not None: warnings.add((src, name))
+            # a new modification time can change the name, release the previous one
+            if cached and self._owners.get(cached[1]) == key: del self._owners[cached[1]]
+            self._cache[key] = [mtime, name, renamed]
+        owner = self._owners.setdefault(name, key)
+        assert owner == key, f'{src} and {owner} would both be published as _posts/{name}, rename one of them.'
+        return name
+
+    def register_site(self, root: Path=Path('.')) -> Dict[Path, str]:
+        "Name every notebook and Word document of the site in `root`, failing fast on collisions."
+        return {p: self.name(p) for d, pattern, skip_private in SOURCES for p in sorted((Path(root)/d).glob(pattern))
+                if not (skip_private and p.name.startswith('_'))}
+
+    def save(self):
+        if self.path is None: return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock: write_atomic(self.path, json.dumps(self._cache, indent=1, sort_keys=True))
+
+registry = PostRegistry(CACHE_DIR/'post_names.json')
@@ -0,0 +1,204 @@
+"""
+Re-encodes the images of the built site as WebP at several widths and animated GIFs as MP4 video, and rewrites
+the pages to serve them responsively. Encoded images are cached by content, so each is only encoded once.
+"""
+import re, html, json, shutil, hashlib, argparse, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+import PIL
+from PIL import Image, ImageSequence
+from manifest import CACHE_DIR, combined_hash, file_hash
+from posts import site_config
+
+# Widths of the WebP versions, the widest also bounds the fallback in the original format
+WIDTHS = (480, 800, 1200)
+# Posts are at most 800px wide in minima
+SIZES = '(max-width: 800px) 100vw, 800px'
+RASTER = ('.png', '.jpg', '.jpeg', '.gif')
+# Where the encoded images go in the site, a folder per image named after its content
+OUT = Path('images/responsive')
+_re_img = re.compile(r'<img\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>', re.I)
+# The fallback `<img>` of a `<picture>` or `<video>` follows its `<source>`
+_re_source_end = re.compile(r'<source\b[^>]*>\s*\Z', re.I)
+_re_attr = re.compile(r'([\w:-]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>]+))?')
+
+def _attrs(tag: str) -> Dict[str, Optional[str]]:
+    "The attributes of html `tag`, unquoted but not unescaped."
+    return {k.lower(): v.strip('"\'') if v else None for k, v in _re_attr.findall(tag[4:-1].rstrip('/'))}
+
+def _tag(name: str, attrs: Dict[str, Optional[str]]) -> str:
+    q = lambda v: f"'{v}'" if '"' in v else f'"{v}"'
+    return f'<{name}' + ''.join(f' {k}' if v is None else f' {k}={q(v)}' for k, v in attrs.items()) + '>'
+
+def _prefixes(cfg: dict) -> List[str]:
+    "Patterns of the URLs that point into the site: absolute ones, and raw GitHub files of the blog's repository."
+    base,repo = cfg.get('baseurl', ''),cfg.get('baseurl', '').strip('/')
+    pats = [re.escape(cfg.get('url', '') + base) + '/'] if cfg.get('url') else []
+    if cfg.get('github_username'):
+        repo = repo or f"{cfg['github_username']}.github.io"
+        pats.append(rf"https://raw\.githubusercontent\.com/{re.escape(cfg['github_username'])}/{re.escape(repo)}/[^/]+/")
+    return pats + [re.escape(base) + '/']
+
+def _resolve(src: str, page: Path, site: Path, prefixes: List[str]) -> Optional[Path]:
+    "The image file of the site that `src` on `page` points to, if it is one this script encodes."
+    src = unquote(html.unescape(src).split('?')[0].split('#')[0])
+    for p in prefixes:
+        m = re.match(p, src)
+        if m: path = site/src[m.end():]; break
+    else:
+        if re.match(r'^(?:[a-z]+:|//|/)', src, re.I): return None
+        path = page.parent/src
+    if path.suffix.lower() not in RASTER or not path.is_file(): return None
+    try: rel = path.resolve().relative_to(site.resolve())
+    except ValueError: return None
+    return None if rel.parts[:len(OUT.parts)] == OUT.parts else path
+
+def _responsive(text: str, m) -> bool:
+    "Whether the `<img>` matched by `m` in `text` has a `srcset` or is in a `<picture>` or `<video>` already."
+    return 'srcset' in _attrs(m[0]) or bool(_re_source_end.search(text, max(0, m.start() - 4096), m.start()))
+
+def page_images(page: Path, site: Path, prefixes: List[str]) -> Dict[str, str]:
+    "Map from the `src` of each `<img>` of `page` to the image file it shows, for the images not yet responsive."
+    text,out = page.read_text(encoding='utf-8', errors='ignore'),{}
+    for m in _re_img.finditer(text):
+        a = _attrs(m[0])
+        if not a.get('src') or _responsive(text, m): continue
+        path = _resolve(a['src'], page, site, prefixes)
+        if path: out[a['src']] = str(path)
+    return out
+
+def _frames(im: Image.Image):
+    frames,durations = [],[]
+    for f in ImageSequence.Iterator(im):
+        frames.append(f.convert('RGBA'))
+        durations.append(f.info.get('duration', im.info.get('duration', 100)))
+    return frames, durations
+
+def encode(src: Path, dest: Path) -> dict:
+    """
+    Write the versions of image `src` to the folder `dest`: WebP at each of `WIDTHS` below its width and at
+    its width, and the original format at up to the widest, or an animated WebP and an MP4 (with ffmpeg) for
+    animations. Only versions smaller than `src` are kept. Return their names and `src`'s size.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    size = src.stat().st_size
+    keep = lambda f: f.exists() and f.stat().st_size < size
+    with Image.open(src) as im:
+        w,h = im.size
+        meta = dict(width=w, height=h, size=size, webp=[], fallback=None, video=None, animation=None)
+        if getattr(im, 'is_animated', False):
+            frames,durations = _frames(im)
+            # Lossless suits the flat colors of GIFs (manim's animations, plots), lossy comes out bigger
+            frames[0].save(dest/'animation.webp', 'WEBP', save_all=True, append_images=frames[1:], duration=durations,
+                           loop=im.info.get('loop', 0), lossless=True, method=6, minimize_size=True)
+            if keep(dest/'animation.webp'): meta['animation'] = 'animation.webp'
+            if shutil.which('ffmpeg'):
+                # H.264 wants even dimensions, and faststart lets the video play before it is all downloaded
+                subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', str(src), '-an', '-c:v', 'libx264', '-crf', '28',
+                                '-pix_fmt', 'yuv420p', '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+                                '-movflags', '+faststart', str(dest/'animation.mp4')], check=True)
+                if keep(dest/'animation.mp4'): meta['video'] = 'animation.mp4'
+            return _drop_unkept(dest, meta)
+        im = im.convert('RGBA' if 'A' in im.getbands() or 'transparency' in im.info else 'RGB')
+        for x in sorted({x for x in WIDTHS if x < w} | {min(w, max(WIDTHS))}):
+            v = im if x == w else im.resize((x, max(1, round(h * x / w))), Image.LANCZOS)
+            v.save(dest/f'{x}.webp', 'WEBP', quality=80, method=6)
+            if keep(dest/f'{x}.webp'): meta['webp'].append([f'{x}.webp', x])
+        x,ext = min(w, max(WIDTHS)),src.suffix.lower()
+        v = im if x == w else im.resize((x, max(1, round(h * x / w))), Image.LANCZOS)
+        if ext in ('.jpg', '.jpeg'):
+            v.convert('RGB').save(dest/f'{x}{ext}', 'JPEG', quality=85, optimize=True, progressive=True)
+        else: v.save(dest/f'{x}.png', 'PNG', optimize=True); ext = '.png'
+        if keep(dest/f'{x}{ext}'): meta['fallback'] = f'{x}{ext}'
+    return _drop_unkept(dest, meta)
+
+def _drop_unkept(dest: Path, meta: dict) -> dict:
+    "Delete the versions in `dest` that `meta` doesn't list, so they aren't deployed."
+    kept = {meta['fallback'], meta['video'], meta['animation']} | {f for f, _ in meta['webp']}
+    for f in dest.iterdir():
+        if f.name not in kept: f.unlink()
+    return meta
+
+def _markup(tag: str, meta: dict, url: str, lazy: bool) -> str:
+    "`<img>` `tag` as a `<picture>` of the versions in `meta`, under `url`, or a `<video>` for an animation."
+    a = _attrs(tag)
+    if lazy: a.setdefault('loading', 'lazy')
+    a.setdefault('decoding', 'async')
+    if meta['video']:
+        img = dict(a, src=f"{url}/{meta['animation']}" if meta['animation'] else a['src'])
+        v = {k: val for k, val in a.items() if k not in ('src', 'alt', 'loading', 'decoding', 'srcset', 'sizes')}
+        if a.get('alt'): v['aria-label'] = a['alt']
+        v.update(autoplay=None, loop=None, muted=None, playsinline=None)
+        source = f'<source src="{url}/{meta["video"]}" type="video/mp4">'
+        return _tag('video', v) + source + _tag('img', img) + '</video>'
+    if meta['animation']: srcset,sizes = f"{url}/{meta['animation']}",None
+    else: srcset,sizes = ', '.join(f'{url}/{f} {x}w' for f, x in meta['webp']),SIZES
+    if not srcset: return tag
+    if meta['fallback']: a['src'] = f"{url}/{meta['fallback']}"
+    source = f'<source type="image/webp" srcset="{srcset}"' + (f' sizes="{sizes}"' if sizes else '') + '>'
+    return f'<picture>{source}{_tag("img", a)}</picture>'
+
+def rewrite_page(page: Path, images: Dict[str, tuple]) -> int:
+    "Replace the `<img>` of `page` whose `src` is in `images` (`src -> (meta, url)`), returning how many were."
+    text,n = page.read_text(encoding='utf-8'),0
+    def sub(m):
+        nonlocal n
+        a = _attrs(m[0])
+        if a.get('src') not in images or _responsive(text, m): return m[0]
+        n += 1
+        # The first image is likely in view, lazy loading would delay it
+        return _markup(m[0], *images[a['src']], lazy=n > 1)
+    text = _re_img.sub(sub, text)
+    if n: page.write_text(text, encoding='utf-8')
+    return n
+
+def deps_hash() -> str:
+    "Changes with this script, Pillow and whether ffmpeg is there, re-encoding every image."
+    return f"{combined_hash([Path(__file__)])}-{PIL.__version__}-{bool(shutil.which('ffmpeg'))}"
+
+def optimize_images(site: Path=Path('_site'), n_workers: int=0, cache_dir: Path=None) -> dict:
+    """
+    Encode the images shown by the pages of `site` on `n_workers` processes (one per core if 0), reusing the
+    versions cached for the same content, copy them to `site/OUT` and rewrite the pages to use them.
+    """
+    site,cache = Path(site),Path(cache_dir or CACHE_DIR)/'images'
+    cfg,deps = site_config(),deps_hash()
+    prefixes,base = _prefixes(cfg),cfg.get('baseurl', '')
+    pages = sorted(site.rglob('*.html'))
+    with ProcessPoolExecutor(n_workers or None) as ex:
+        refs = dict(zip(pages, ex.map(partial(page_images, site=site, prefixes=prefixes), pages, chunksize=8)))
+        files = sorted({Path(f) for r in refs.values() for f in r.values()})
+        # Copies of one image (e.g. in images/copied_from_nb) share a key, and are encoded once
+        keys = {f: hashlib.sha256(f'{file_hash(f)}-{deps}'.encode()).hexdigest()[:20] for f in files}
+        todo = {k: f for f, k in keys.items() if not (cache/k/'meta.json').exists()}
+        for k, meta in zip(todo, ex.map(encode, todo.values(), [cache/k for k in todo])):
+            (cache/k/'meta.json').write_text(json.dumps(meta))
+        metas = {k: json.loads((cache/k/'meta.json').read_text()) for k in set(keys.values())}
+        for k in metas:
+            if (site/OUT/k).exists(): shutil.rmtree(site/OUT/k)
+            shutil.copytree(cache/k, site/OUT/k, ignore=shutil.ignore_patterns('meta.json'))
+        todo_pages = [p for p in pages if refs[p]]
+        url = lambda f: f'{base}/{OUT.as_posix()}/{keys[Path(f)]}'
+        images = [{src: (metas[keys[Path(f)]], url(f)) for src, f in refs[p].items()} for p in todo_pages]
+        rewritten = sum(ex.map(rewrite_page, todo_pages, images))
+    # Drop what no page of this site shows anymore, including pages rewritten by an earlier run
+    live = set(metas) | {d.name for d in (site/OUT).iterdir()} if (site/OUT).exists() else set(metas)
+    for d in cache.iterdir() if cache.exists() else []:
+        if d.name not in live: shutil.rmtree(d)
+    # What a browser showing the widest version downloads
+    best = lambda m: m['video'] or m['animation'] or (m['webp'][-1][0] if m['webp'] else m['fallback'])
+    served = lambda k, m: (site/OUT/k/best(m)).stat().st_size if best(m) else m['size']
+    return dict(images=len(metas), encoded=len(todo), tags=rewritten, before=sum(m['size'] for m in metas.values()),
+                after=sum(served(k, m) for k, m in metas.items()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('site', nargs='?', default='_site', help='the site Jekyll built')
+    parser.add_argument('--workers', type=int, default=0, help='processes, 0 for one per core')
+    args = parser.parse_args()
+    s = optimize_images(Path(args.site), n_workers=args.workers)
+    print(f"{s['images']} images ({s['encoded']} encoded, the others from the cache) in {s['tags']} <img> tags: "
+          f"{s['before']:,} bytes down to {s['after']:,} at the widest")
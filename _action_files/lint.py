@@ -0,0 +1,161 @@
+"""Formats (isort, black) and lints (flake8's checks) the code cells of notebooks in one pass, caching each cell"""
+import re, ast, sys, json, hashlib, argparse, configparser
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import List, Tuple
+import nbformat, black, isort, pycodestyle, pyflakes.checker
+from flake8.plugins.pyflakes import FLAKE8_PYFLAKES_CODES
+from manifest import CACHE_DIR
+
+# Cell magics whose body is Python, checked like any other cell; cells of other cell magics (%%bash, ...) are left alone
+PYTHON_CELL_MAGICS = {'time', 'timeit', 'capture', 'prun', 'debug', 'memit'}
+# Notebooks import in whatever cell needs it
+NOTEBOOK_IGNORE = ('E402',)
+_re_magic = re.compile(r'^\s*(?:[%!?]|[\w, ]+=\s*[%!]|[\w.]+\?{1,2}\s*$)')
+_re_placeholder = re.compile(r'^[ \t]*# MAGIC (\w+)$', re.M)
+_re_noqa = re.compile(r'#\s*noqa(?::\s*([\w, ]+))?', re.I)
+
+def settings(root: Path=Path('.')) -> dict:
+    "flake8 options of the `.flake8` in `root`, plus `NOTEBOOK_IGNORE`."
+    cfg = configparser.ConfigParser(inline_comment_prefixes=('#',))
+    cfg.read(Path(root)/'.flake8')
+    ignore = [c.strip() for c in cfg.get('flake8', 'ignore', fallback='').split(',') if c.strip()]
+    return dict(max_line_length=cfg.getint('flake8', 'max-line-length', fallback=88),
+                ignore=sorted({*ignore, *NOTEBOOK_IGNORE}), root=str(Path(root).absolute()))
+
+# isort reads its settings (`profile = "black"` in pyproject.toml) from disk, once per process
+@lru_cache()
+def _isort_config(root: str) -> isort.Config: return isort.Config(settings_path=root)
+
+def mask_magics(src: str):
+    """
+    `src` with IPython magics and shell commands replaced by placeholder comments, and the lines they replaced.
+    `None` for cells of a cell magic that does not run Python.
+    """
+    lines,magics = src.split('\n'),{}
+    if lines[0].startswith('%%'):
+        if lines[0][2:].split(' ')[0] not in PYTHON_CELL_MAGICS: return None, {}
+    out,cont,indent = [],False,''
+    for i, line in enumerate(lines):
+        if cont or (i == 0 and line.startswith('%%')) or _re_magic.search(line):
+            key = hashlib.sha1(f'{i}{line}'.encode()).hexdigest()[:10]
+            magics[key] = line
+            # lines continuing a shell command keep the indent of its first line, not theirs, which isn't Python's
+            if not cont: indent = line[:len(line) - len(line.lstrip())]
+            out.append(indent + f'# MAGIC {key}')
+            # shell commands carry on over lines ending with a backslash
+            cont = line.endswith('\\')
+        else: out.append(line)
+    return '\n'.join(out), magics
+
+def unmask_magics(src: str, magics: dict) -> str: return _re_placeholder.sub(lambda m: magics[m[1]], src)
+
+def format_cell(src: str, opts: dict) -> str:
+    "`src` sorted by isort and formatted by black, unchanged when either cannot parse it."
+    masked,magics = mask_magics(src)
+    if masked is None: return src
+    try:
+        out = isort.code(masked, config=_isort_config(opts['root']))
+        out = black.format_str(out, mode=black.Mode(line_length=opts['max_line_length']))
+    except Exception: return src
+    return unmask_magics(out, magics).rstrip('\n')
+
+class _Report(pycodestyle.BaseReport):
+    "Collect pycodestyle's errors instead of printing them"
+    def __init__(self, options):
+        super().__init__(options)
+        self.errors = []
+
+    def error(self, line_number, offset, text, check):
+        code = super().error(line_number, offset, text, check)
+        if code: self.errors.append((line_number, offset + 1, text))
+        return code
+
+def check_code(code: str, opts: dict) -> List[Tuple[int, int, str]]:
+    "`(line, column, message)` of what flake8 would report on `code`."
+    try: tree = ast.parse(code)
+    except SyntaxError as e: return [(e.lineno or 1, e.offset or 1, f'E999 SyntaxError: {e.msg}')]
+    errors = [(m.lineno, getattr(m, 'col', 0) + 1,
+               f"{FLAKE8_PYFLAKES_CODES.get(type(m).__name__, 'F999')} {m.message % m.message_args}")
+              for m in pyflakes.checker.Checker(tree, filename='<notebook>').messages]
+    style = pycodestyle.StyleGuide(max_line_length=opts['max_line_length'], reporter=_Report)
+    checker = pycodestyle.Checker(lines=code.splitlines(True), options=style.options, report=_Report(style.options))
+    checker.check_all()
+    lines = code.split('\n')
+    def keep(line, text):
+        code = text.split(' ')[0]
+        if code.startswith(tuple(opts['ignore'])): return False
+        noqa = _re_noqa.search(lines[line - 1]) if line <= len(lines) else None
+        return not noqa or (noqa[1] is not None and code not in re.split(r'[\s,]+', noqa[1]))
+    return sorted(e for e in errors + checker.report.errors if keep(e[0], e[2]))
+
+def _key(*parts) -> str: return hashlib.sha256('\0'.join(map(str, parts)).encode()).hexdigest()
+
+def lint(nb_path: Path, check: bool=False, cache_dir: Path=None, root: Path=Path('.')) -> Tuple[bool, List[str]]:
+    """
+    Format the code cells of `nb_path` (only report it with `check`) and lint them as one file, as nbqa does.
+    Return whether it was (or would be) reformatted and the flake8 messages, each cell's position as `cell_N`.
+    """
+    nb_path,opts = Path(nb_path),settings(root)
+    cache_path = Path(cache_dir or CACHE_DIR)/'lint'/f'{nb_path.stem}.json'
+    try: cache = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+    except ValueError: cache = {}
+    # Different tool versions or settings format differently
+    pyproject = Path(root)/'pyproject.toml'
+    config = _key(black.__version__, isort.__version__, pycodestyle.__version__, pyflakes.__version__,
+                  json.dumps(opts), pyproject.read_text() if pyproject.exists() else '')
+    nb = nbformat.read(str(nb_path), as_version=4)
+    used,changed = {},False
+    cells = [(i, c) for i, c in enumerate(nb.cells) if c.cell_type == 'code' and c.source.strip()]
+    for _, cell in cells:
+        k = _key(config, cell.source)
+        out = cache.get(k)
+        if out is None: out = format_cell(cell.source, opts)
+        # Formatted cells are formatted already, next run finds them under their new source too
+        used[k] = used[_key(config, out)] = out
+        if out != cell.source:
+            changed = True
+            if not check: cell.source = out
+    if changed and not check: nbformat.write(nb, str(nb_path))
+
+    # Cells are linted as a single file so names defined in earlier cells are known, two blank lines apart
+    code,starts = '',[]
+    for i, cell in cells:
+        masked,_ = mask_magics(cell.source)
+        if masked is None: continue
+        starts.append((code.count('\n') + 1, i))
+        code += masked.rstrip('\n') + '\n\n\n'
+    code = code.rstrip('\n') + '\n'
+    k = _key(config, code)
+    errors = cache.get(k)
+    if errors is None: errors = check_code(code, opts)
+    used[k] = errors
+    messages = []
+    for line, col, text in errors:
+        start,i = next(s for s in reversed(starts) if s[0] <= line) if starts else (1, 0)
+        messages.append(f'{nb_path}:cell_{i + 1}:{line - start + 1}:{col}: {text}')
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(json.dumps(used))
+    return changed, messages
+
+def lint_all(paths: List[Path], check: bool=False, n_workers: int=0) -> bool:
+    "Lint `paths` on `n_workers` processes (one per core if 0), print the results and return whether all are clean."
+    clean = True
+    with ProcessPoolExecutor(n_workers or None) as ex:
+        for nb, (changed, messages) in zip(paths, ex.map(lint, paths, repeat(check))):
+            if changed: print(f"{'would reformat' if check else 'reformatted'} {nb}")
+            for m in messages: print(m)
+            clean &= not messages and not (changed and check)
+    return clean
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('paths', nargs='*', default=['_notebooks'], help='notebooks or folders of notebooks')
+    parser.add_argument('--check', action='store_true', help="report the cells to reformat, don't write them")
+    parser.add_argument('--workers', type=int, default=0, help='processes, 0 for one per core')
+    args = parser.parse_args()
+    paths = sorted({nb for p in map(Path, args.paths) for nb in (p.rglob('*.ipynb') if p.is_dir() else [p])
+                    if '.ipynb_checkpoints' not in nb.parts})
+    sys.exit(0 if lint_all(paths, check=args.check, n_workers=args.workers) else 1)
@@ -0,0 +1,94 @@
+"""Persisted content-hash manifests used to skip work whose inputs have not changed"""
+import hashlib, json, os, shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+# Build caches live in a dot-directory so Jekyll never publishes them
+CACHE_DIR = Path(os.environ.get('FASTPAGES_CACHE_DIR', '.fastpages_cache'))
+
+def file_hash(path: Union[str, Path], chunk_size: int=1 << 20) -> str:
+    "Return the sha256 hex digest of the file at `path`, read in chunks."
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''): h.update(chunk)
+    return h.hexdigest()
+
+def write_atomic(path: Path, text: str):
+    "Write `text` to `path` through a temporary file, so a concurrent reader or writer never sees half of it."
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_text(text)
+    tmp.replace(path)
+
+def combined_hash(paths: Iterable[Union[str, Path]]) -> str:
+    "Return a single digest for the contents of all existing `paths`, in the given order."
+    h = hashlib.sha256()
+    for p in paths:
+        p = Path(p)
+        h.update(str(p.name).encode())
+        h.update(file_hash(p).encode() if p.exists() else b'missing')
+    return h.hexdigest()
+
+class Manifest:
+    """
+    JSON record of `source -> {hash, outputs}` for one build stage.
+
+    An entry is fresh when the source hash and the hash of the stage's shared dependencies
+    (templates, settings, ...) are unchanged and every output recorded for it still exists
+    with the contents we wrote. With `store=True` a copy of each output is kept in the cache
+    so outputs missing from a fresh checkout (e.g. in CI) are restored instead of rebuilt.
+    """
+    def __init__(self, name: str, deps_hash: str='', cache_dir: Path=None, store: bool=False):
+        self.path = Path(cache_dir or CACHE_DIR)/f'{name}.json'
+        self.blobs = self.path.parent/name
+        self.deps_hash,self.store = deps_hash,store
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            try: data = json.loads(self.path.read_text())
+            except ValueError: data = {}
+            # A change to the shared dependencies invalidates every entry
+            if data.get('deps_hash') == deps_hash: self.entries = data.get('entries', {})
+
+    def is_fresh(self, src: Union[str, Path], src_hash: Optional[str]=None) -> bool:
+        "Whether `src` and the outputs recorded for it are unchanged since the last `record`."
+        entry = self.entries.get(str(src))
+        if entry is None or not Path(src).exists(): return False
+        if (src_hash or file_hash(src)) != entry['hash']: return False
+        return all(self._check_output(Path(o), h) for o, h in entry['outputs'].items())
+
+    def _check_output(self, out: Path, h: str) -> bool:
+        if out.exists() and file_hash(out) == h: return True
+        blob = self.blobs/h
+        if not (self.store and blob.exists()): return False
+        out.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(blob, out)
+        return True
+
+    def record(self, src: Union[str, Path], outputs: Iterable[Union[str, Path]], src_hash: Optional[str]=None, **extra):
+        "Store the current hash of `src` and of each produced output in `outputs`."
+        hashes = {str(o): file_hash(o) for o in outputs if Path(o).exists()}
+        if self.store:
+            self.blobs.mkdir(parents=True, exist_ok=True)
+            for o, h in hashes.items():
+                if not (self.blobs/h).exists(): shutil.copyfile(o, self.blobs/h)
+        self.entries[str(src)] = dict(hash=src_hash or file_hash(src), outputs=hashes, **extra)
+
+    def outputs(self, src: Union[str, Path]) -> List[str]:
+        "Outputs recorded for `src`, empty if it was never recorded."
+        return list(self.entries.get(str(src), {}).get('outputs', {}))
+
+    def prune(self, sources: Iterable[Union[str, Path]]) -> List[str]:
+        "Drop entries whose source is not in `sources` and return their names."
+        keep = {str(s) for s in sources}
+        dropped = [s for s in self.entries if s not in keep]
+        for s in dropped: del self.entries[s]
+        return dropped
+
+    def save(self):
+        "Write the manifest and drop stored outputs no entry refers to anymore."
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.store and self.blobs.exists():
+            live = {h for e in self.entries.values() for h in e['outputs'].values()}
+            for blob in self.blobs.iterdir():
+                if blob.name not in live: blob.unlink()
+        write_atomic(self.path, json.dumps(dict(deps_hash=self.deps_hash, entries=self.entries), indent=1,
+                                           sort_keys=True))
@@ -0,0 +1,119 @@
+"""Minifies the HTML, CSS and JavaScript of the built site in place and writes .gz and .br copies of its text files"""
+import re, gzip, argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+import brotli, rcssmin, rjsmin
+from manifest import Manifest, combined_hash, file_hash
+
+MINIFY = ('.html', '.css', '.js')
+COMPRESS = MINIFY + ('.json', '.xml', '.svg', '.txt', '.map')
+# Smaller files fit in a packet either way, web servers skip their compressed copies too
+MIN_COMPRESS = 1024
+# Whitespace next to these tags is not rendered
+BLOCK = {'!doctype', 'html', 'head', 'body', 'title', 'meta', 'link', 'base', 'div', 'p', 'ul', 'ol', 'li', 'dl', 'dt',
+         'dd', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th', 'caption', 'colgroup', 'col', 'section', 'article',
+         'aside', 'header', 'footer', 'nav', 'main', 'figure', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+         'form', 'fieldset', 'legend', 'blockquote', 'details', 'summary', 'noscript', 'pre', 'br'}
+_JS_TYPES = ('', 'text/javascript', 'application/javascript', 'module', 'application/ld+json')
+_attrs = r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*'
+# Elements kept as they are (`<code>` and `<pre>` keep their whitespace, scripts and styles get minified), comments, tags
+_re_token = re.compile(rf'<(pre|textarea|code|script|style)\b({_attrs})>(.*?)</\1\s*>|<!--.*?-->|<[!/]?[a-zA-Z]{_attrs}>',
+                       re.S | re.I)
+_re_name = re.compile(r'<[/]?([!\w:-]+)')
+_re_type = re.compile(r'\stype\s*=\s*["\']?([^"\'\s>]*)', re.I)
+_re_space = re.compile(r'\s+')
+
+def _name(tag: str) -> str: return _re_name.match(tag)[1].lower()
+
+def _collapse(text: str, before: str, after: str) -> str:
+    "`text` between tags `before` and `after` with runs of whitespace as one space, or one newline if they had one."
+    if before in BLOCK: text = text.lstrip()
+    if after in BLOCK: text = text.rstrip()
+    # Newlines stay newlines: they end `%` comments in the TeX of the posts
+    return _re_space.sub(lambda m: '\n' if '\n' in m[0] else ' ', text)
+
+def _element(m) -> str:
+    tag,attrs,body = m[1].lower(),m[2],m[3]
+    if tag == 'style': body = rcssmin.cssmin(body)
+    elif tag == 'script':
+        t = _re_type.search(attrs)
+        # MathJax reads its TeX from scripts of type math/tex
+        if (t[1].lower() if t else '') in _JS_TYPES: body = rjsmin.jsmin(body)
+    return f'<{m[1]}{attrs}>{body}</{m[1]}>'
+
+def minify_html(html: str) -> str:
+    "`html` without comments and the whitespace browsers don't render, with its inline scripts and styles minified."
+    out,text,pos,prev = [],'',0,''
+    for m in _re_token.finditer(html):
+        text += html[pos:m.start()]
+        pos,tok = m.end(),m[0]
+        # Conditional comments are markup for old browsers
+        if tok.startswith('<!--') and not ('[if' in tok or 'endif]' in tok): continue
+        name = m[1].lower() if m[1] else _name(tok) if not tok.startswith('<!--') else prev
+        out += [_collapse(text, prev, name), _element(m) if m[1] else tok]
+        text,prev = '',name
+    out.append(_collapse(text + html[pos:], prev, ''))
+    return ''.join(out)
+
+MINIFIERS = {'.html': minify_html, '.css': rcssmin.cssmin, '.js': rjsmin.jsmin}
+
+def _compress(path: Path, data: bytes) -> List[Path]:
+    "Write the gzip and brotli copies of `path` that are worth it, deleting the others, and return them."
+    written = []
+    for ext, compress in (('.gz', lambda d: gzip.compress(d, 9, mtime=0)), ('.br', lambda d: brotli.compress(d, quality=11))):
+        out = path.with_name(path.name + ext)
+        z = compress(data) if len(data) >= MIN_COMPRESS else data
+        if len(z) < len(data):
+            out.write_bytes(z)
+            written.append(out)
+        elif out.exists(): out.unlink()
+    return written
+
+def process(path: Path) -> List[Path]:
+    "Minify `path` in place if it is HTML, CSS or JavaScript, compress it and return the files written."
+    data = path.read_bytes()
+    if path.suffix in MINIFY and not path.name.endswith(('.min.js', '.min.css')):
+        try: mini = MINIFIERS[path.suffix](data.decode('utf-8')).encode('utf-8')
+        except UnicodeDecodeError: mini = data
+        if len(mini) < len(data): path.write_bytes(mini); data = mini
+    return [path] + _compress(path, data)
+
+def deps_hash() -> str:
+    "Changes with this script and the minifier and compressor versions, invalidating every cached file."
+    return f'{combined_hash([Path(__file__)])}-{rcssmin.__version__}-{rjsmin.__version__}-{brotli.__version__}'
+
+def _done(manifest: Manifest, f: Path, h: str) -> bool:
+    "Whether `f` is what the last run wrote for it, i.e. Jekyll didn't rebuild the site since."
+    outputs = manifest.entries.get(str(f), {}).get('outputs', {})
+    return outputs.get(str(f)) == h and all(Path(o).exists() for o in outputs)
+
+def minify(site: Path=Path('_site'), n_workers: int=0) -> dict:
+    """
+    Minify and compress the text files of `site` on `n_workers` processes (one per core if 0). Files whose
+    content was processed before are restored from the cache instead. Return the sizes before and after.
+    """
+    files = sorted(f for f in Path(site).rglob('*') if f.is_file() and f.suffix in COMPRESS)
+    manifest = Manifest('minify', deps_hash(), store=True)
+    hashes = {f: file_hash(f) for f in files}
+    sizes = {f: f.stat().st_size for f in files}
+    # A fresh entry restores the minified file over the one Jekyll wrote, and its compressed copies
+    todo = [f for f in files if not (manifest.is_fresh(f, hashes[f]) or _done(manifest, f, hashes[f]))]
+    with ProcessPoolExecutor(n_workers or None) as ex:
+        for f, outputs in zip(todo, ex.map(process, todo, chunksize=16)):
+            manifest.record(f, outputs, src_hash=hashes[f])
+    manifest.prune(files)
+    manifest.save()
+    size = lambda f: f.stat().st_size if f.exists() else 0
+    return dict(files=len(files), cached=len(files) - len(todo), before=sum(sizes.values()),
+                after=sum(map(size, files)), gz=sum(size(f.with_name(f.name + '.gz')) or size(f) for f in files),
+                br=sum(size(f.with_name(f.name + '.br')) or size(f) for f in files))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('site', nargs='?', default='_site', help='the site Jekyll built')
+    parser.add_argument('--workers', type=int, default=0, help='processes, 0 for one per core')
+    args = parser.parse_args()
+    s = minify(Path(args.site), n_workers=args.workers)
+    print(f"{s['files']} files ({s['cached']} from the cache): {s['before']:,} bytes minified to {s['after']:,}, "
+          f"{s['gz']:,} with gzip and {s['br']:,} with brotli")
@@ -1,22 +1,274 @@
 """Converts Jupyter Notebooks to Jekyll compliant blog posts"""
 from datetime import datetime
-import re, os, logging
+import re, os, logging, argparse, itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, lru_cache
+from pathlib import Path
 from nbdev import export2html
-from nbdev.export2html import Config, Path, _re_digits, _to_html, _re_block_notes
-from fast_template import rename_for_jekyll
+from nbdev.export2html import Config
+from fast_template import registry
+from asset_index import index, referenced_assets
+from jinja2 import FileSystemBytecodeCache
+import nbformat
+from nbstream import iter_notebook
+from manifest import CACHE_DIR, Manifest, combined_hash, file_hash
+from preprocessors import ExtractImages, OutputBudget, budget_report, print_heaviest
+from posts import site_config
+from profiling import profiler
 
 warnings = set()
-    
+TEMPLATE = Path(__file__).parent/'fastpages.tpl'
+# Post names computed up front by the parent process, so every worker agrees on them
+_names = {}
+# One exporter per template and process: nbconvert keeps the compiled template on it
+_exporters = {}
+
 # Modify the naming process such that destination files get named properly for Jekyll _posts
-def _nb2htmlfname(nb_path, dest=None): 
-    fname = rename_for_jekyll(nb_path, warnings=warnings)
-    if dest is None: dest = Config().doc_path
+def _nb2htmlfname(nb_path, dest=None):
+    nb_path = Path(nb_path).absolute()
+    fname = _names.get(nb_path) or registry.name(nb_path, warnings=warnings)
+    if dest is None: dest = _cfg_path('doc_path')
     return Path(dest)/fname
 
-# TODO: Open a GitHub Issue in addition to printing warnings
-for original, new in warnings:
-    print(f'{original} has been renamed to {new} to be complaint with Jekyll naming conventions.\n')
-    
+class _TimedWrite:
+    "File nbdev opened to write a post, recording each write as the `write` stage"
+    def __init__(self, f): self.f = f
+    def __enter__(self): return self
+    def __exit__(self, *exc): return self.f.__exit__(*exc)
+    def __getattr__(self, k): return getattr(self.f, k)
+    def write(self, s):
+        with profiler.stage('write'): return self.f.write(s)
+
+def _open(file, mode='r', *args, **kwargs):
+    f = open(file, mode, *args, **kwargs)
+    return _TimedWrite(f) if 'w' in mode else f
+
 ## apply monkey patches
 export2html._nb2htmlfname = _nb2htmlfname
-export2html.notebook2html(fname='_notebooks/*.ipynb', dest='_posts/', template_file='/fastpages/fastpages.tpl')
+if profiler.enabled:
+    export2html.read_nb = profiler.timed('parse')(export2html.read_nb)
+    export2html.open = _open
+
+def deps_hash(template_file=TEMPLATE) -> str:
+    "Hash of everything besides the notebook itself that changes the rendered post."
+    template_file = Path(template_file)
+    return combined_hash([template_file, template_file.parent/'hide.tpl', Path('settings.ini')])
+
+def get_exporter(template_file=TEMPLATE):
+    "nbdev's exporter for `template_file` with our preprocessors registered, built once per process."
+    if str(template_file) in _exporters: return _exporters[str(template_file)]
+    exporter = export2html.nbdev_exporter(template_file=str(template_file))
+    # Compiled templates persist across runs and workers; jinja checks each entry against the
+    # template source, so editing fastpages.tpl/hide.tpl invalidates it
+    (CACHE_DIR/'jinja').mkdir(parents=True, exist_ok=True)
+    exporter.environment.bytecode_cache = FileSystemBytecodeCache(str((CACHE_DIR/'jinja').absolute()))
+    dest, url = _images_dest()
+    exporter.register_preprocessor(ExtractImages(dest=str(dest), url=url), enabled=True)
+    # After ExtractImages, so image payloads already moved out of the outputs don't count
+    exporter.output_budget = OutputBudget()
+    exporter.register_preprocessor(exporter.output_budget, enabled=True)
+    if profiler.enabled:
+        from_notebook_node = exporter.from_notebook_node
+        def _render(nb, *args, **kwargs):
+            with profiler.stage('render'): return from_notebook_node(nb, *args, **kwargs)
+        exporter.from_notebook_node = _render
+    _exporters[str(template_file)] = exporter
+    return exporter
+
+def _cfg_path(k: str) -> Path:
+    "Path `k` of settings.ini: an attribute in nbdev 0.2, which the action runs, `path(k)` in nbdev 1."
+    cfg = Config()
+    return Path(cfg.path(k) if hasattr(cfg, 'path') else getattr(cfg, k))
+
+def _images_dest():
+    "Directory and URL prefix for the image outputs extracted from notebooks, under the baseurl of _config.yml."
+    # settings.ini's doc_baseurl is nbdev's docs site, not where Jekyll serves this one
+    url = f"{site_config().get('baseurl', '')}/{Config().get('doc_path').strip('/')}/outputs/"
+    return _cfg_path('doc_path')/'outputs', url
+
+def produced(post: Path) -> list:
+    "`post` followed by the extracted images it references, i.e. everything a conversion wrote for it."
+    dest, url = _images_dest()
+    pat,imgs = re.compile(re.escape(url) + r'([0-9a-f]+\.\w+)'),set()
+    # Line by line, posts of big notebooks can take hundreds of MB
+    with open(post, encoding='utf-8') as f:
+        for line in f: imgs.update(pat.findall(line))
+    return [post] + [dest/i for i in sorted(imgs)]
+
+def references(nb: Path, nb_hash: str) -> list:
+    "Assets the markdown of `nb` points to, parsed again only when the notebook changed."
+    entry = index.get(nb)
+    return entry['referenced'] if entry.get('hash') == nb_hash else referenced_assets(nb)
+
+def copies(nb: Path, refs: list) -> list:
+    "Where nbdev copies the images `nb` references relative to itself."
+    doc_path = _cfg_path('doc_path')
+    return [doc_path/os.path.relpath(r, nb.parent) for r in refs if not os.path.relpath(r, nb.parent).startswith('..')]
+
+@lru_cache()
+def _re_cell_to_execute():
+    "The cells nbdev runs in a kernel, as its `_re_cell_to_execute`, which nbdev 1 doesn't have."
+    return re.compile(rf'^\s*show_doc\(([^\)]*)\)|^from {re.escape(Config().lib_name)}\.', re.MULTILINE)
+
+def _needs_kernel(cell) -> bool:
+    "Whether nbdev runs code for `cell`: `show_doc` calls, imports from the library and what `#export` documents."
+    e = export2html
+    if cell.cell_type != 'code': return False
+    return bool(_re_cell_to_execute().search(cell.source) or e.check_re(cell, e._re_export) or e.find_default_export([cell]))
+
+# Stands in for the cells when rendering the post around them
+_CELLS_MARK = '<!-- nb2post: cells go here -->'
+
+def convert_streaming(nb_path, dest='_posts/', template_file=TEMPLATE) -> bool:
+    """
+    Convert `nb_path` as `export2html.convert_nb` does, but reading, rendering and writing one cell at a time, so
+    memory is bounded by the largest cell instead of the whole notebook. Returns `False` without writing anything
+    for the notebooks nbdev has to run in a kernel, which need the whole notebook in memory.
+    """
+    fname = Path(nb_path).absolute()
+    # nbdev takes the title cell out of the notebook and the notebook's metadata comes after its cells: read it all once
+    title,meta,top,n = None,None,{},0
+    with profiler.stage('parse'):
+        for k, v in iter_notebook(fname):
+            if k != 'cell': top[k] = v; continue
+            if title is None and v.cell_type == 'markdown':
+                cells = [v]
+                m = export2html.get_metadata(cells)
+                if not cells: title,meta = n,m
+            if _needs_kernel(v): return False
+            n += 1
+    if top.get('nbformat') != 4: return False
+    meta = meta or export2html.get_metadata([])
+    meta['nb_path'] = str(fname.relative_to(_cfg_path('lib_path').absolute().parent))
+    # nbdev's kernel replaces the notebook's language, which picks the syntax highlighting
+    top.setdefault('metadata', {})['language_info'] = dict(name='python', pygments_lexer='ipython3')
+
+    exporter = get_exporter(template_file)
+    def _render(cells):
+        nb = nbformat.v4.new_notebook(cells=cells, metadata=top['metadata'], nbformat_minor=top.get('nbformat_minor', 4))
+        with profiler.stage('render'): return exporter.from_notebook_node(nb, resources=dict(meta))[0]
+    mark = nbformat.from_dict(dict(cell_type='raw', source=_CELLS_MARK, metadata=dict(raw_mimetype='text/html')))
+    head,_,foot = _render([mark]).partition(_CELLS_MARK)
+    assert foot, f"{template_file} doesn't render raw cells, {nb_path} can't be converted a cell at a time"
+    process = export2html.compose(partial(export2html.copy_images, fname=fname, dest=_cfg_path('doc_path')),
+                                  *export2html.process_cell, export2html.treat_backticks, export2html.clean_exports)
+    # nbdev adds a hidden cell importing show_doc first
+    first = export2html.clean_exports(nbformat.from_dict(export2html._import_show_doc_cell()))
+    post = _nb2htmlfname(fname, dest=dest)
+    tmp = post.with_name(f'.{post.name}.{os.getpid()}')
+    budget = exporter.output_budget
+    budget.stream = dict(cell=0, bytes=0)
+    try:
+        with open(tmp, 'w') as f:
+            f.write(head)
+            raw = (v for k, v in iter_notebook(fname) if k == 'cell')
+            cells = (process(c) for i, r in enumerate(raw) if i != title for c in export2html.compose(*export2html.process_cells)([r]))
+            for cell in itertools.chain([first], cells):
+                out = _render([cell])
+                assert out.startswith(head) and out.endswith(foot), f'cell {budget.stream["cell"]} of {nb_path} changes the post around it'
+                with profiler.stage('write'): f.write(out[len(head):len(out) - len(foot)])
+                budget.stream['cell'] += 1
+            f.write(foot)
+        tmp.replace(post)
+    finally:
+        budget.stream = None
+        if tmp.exists(): tmp.unlink()
+    return True
+
+def convert(nb_path, dest='_posts/', template_file=TEMPLATE, stream=False) -> bool:
+    """
+    Convert a single notebook to a post in `dest`, returning whether it succeeded. With `stream`, one cell at a time
+    unless nbdev has to run it.
+    """
+    print(f"converting: {nb_path}")
+    try:
+        with profiler.stage('convert', nb_path):
+            if not (stream and convert_streaming(nb_path, dest=dest, template_file=template_file)):
+                export2html.convert_nb(nb_path, template_file=str(template_file), exporter=get_exporter(template_file), dest=dest)
+        return True
+    except Exception as e:
+        print(e)
+        return False
+
+def _convert_worker(nb_path, dest, template_file, name, stream=False):
+    # Post names come from the parent, so every worker agrees on them
+    _names[Path(nb_path).absolute()] = name
+    warnings.clear()
+    ok = convert(nb_path, dest=dest, template_file=template_file, stream=stream)
+    # Module globals don't travel back from a worker, so hand its rename warnings, timings and output sizes to the parent
+    report = budget_report[:]
+    budget_report.clear()
+    return ok, set(warnings), profiler.drain(), report
+
+def convert_many(nbs, dest='_posts/', template_file=TEMPLATE, n_workers=1, executor=None, stream_above=None):
+    """
+    Convert `nbs` using `n_workers` processes (all cores if 0), or the process pool `executor` shared with other
+    conversions, and yield `(nb, ok)` in input order. Notebooks over `stream_above` bytes are converted a cell at a time.
+    """
+    _names.update({nb.absolute(): registry.name(nb, warnings=warnings) for nb in nbs})
+    stream = {nb: stream_above is not None and nb.stat().st_size > stream_above for nb in nbs}
+    if executor is None and (n_workers == 1 or len(nbs) < 2):
+        for nb in nbs: yield nb, convert(nb, dest=dest, template_file=template_file, stream=stream[nb])
+        return
+    ex = executor or ProcessPoolExecutor(n_workers or None)
+    try:
+        futs = [ex.submit(_convert_worker, nb, dest, template_file, _names[nb.absolute()], stream[nb]) for nb in nbs]
+        for nb, fut in zip(nbs, futs):
+            ok, ws, records, report = fut.result()
+            warnings.update(ws)
+            profiler.records += records
+            budget_report.extend(report)
+            yield nb, ok
+    finally:
+        if executor is None: ex.shutdown()
+
+def nb2post(fname='_notebooks/*.ipynb', dest='_posts/', template_file=TEMPLATE, incremental=False, n_workers=1,
+            executor=None, stream_above=None):
+    """
+    Convert all notebooks matching `fname`, skipping unchanged ones when `incremental`, and the ones over
+    `stream_above` bytes a cell at a time.
+    """
+    p = Path(fname)
+    nbs = sorted(f for f in p.parent.glob(p.name) if not f.name.startswith('_'))
+    # fail before converting anything if a notebook and a Word document would overwrite each other
+    registry.register_site()
+    manifest = Manifest('nb2post', deps_hash(template_file), store=True) if incremental else None
+    nb_hashes = {nb: file_hash(nb) for nb in nbs}
+    refs = {nb: references(nb, nb_hashes[nb]) for nb in nbs}
+    # A changed image rebuilds the posts referencing it, and only those
+    hashes = {nb: combined_hash([nb, *refs[nb]]) if refs[nb] else nb_hashes[nb] for nb in nbs}
+    todo = [nb for nb in nbs if manifest is None or not manifest.is_fresh(nb, hashes[nb])]
+    for nb in set(nbs) - set(todo): index.update(nb, refs[nb], manifest.outputs(nb), hash=nb_hashes[nb])
+    failed = []
+    for nb, ok in convert_many(todo, dest=dest, template_file=template_file, n_workers=n_workers, executor=executor,
+                               stream_above=stream_above):
+        if not ok: failed.append(nb); continue
+        outputs = produced(_nb2htmlfname(nb, dest=dest)) + [c for c in copies(nb, refs[nb]) if c.exists()]
+        index.update(nb, refs[nb], outputs, hash=nb_hashes[nb])
+        if manifest is not None: manifest.record(nb, outputs, src_hash=hashes[nb])
+    if manifest is not None:
+        manifest.prune(nbs)
+        manifest.save()
+    registry.save()
+    index.save()
+
+    # TODO: Open a GitHub Issue in addition to printing warnings
+    for original, new in sorted(warnings, key=str):
+        print(f'{original} has been renamed to {new} to be complaint with Jekyll naming conventions.\n')
+    if failed: print("Conversion failed on the following:\n" + '\n'.join(f.name for f in failed))
+    print_heaviest(budget_report)
+    profiler.save('nb2post')
+    return not failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fname', default='_notebooks/*.ipynb', help='glob of notebooks to convert')
+    parser.add_argument('--dest', default='_posts/')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip notebooks whose content, templates and settings.ini are unchanged since the last run')
+    parser.add_argument('--workers', type=int, default=1, help='number of conversion processes, 0 for one per core')
+    parser.add_argument('--stream-above', type=float, default=None, metavar='MB',
+                        help='convert notebooks larger than this a cell at a time, bounding memory by the largest cell')
+    args = parser.parse_args()
+    stream_above = None if args.stream_above is None else int(args.stream_above * 2**20)
+    nb2post(args.fname, dest=args.dest, incremental=args.incremental, n_workers=args.workers, stream_above=stream_above)
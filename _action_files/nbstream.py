@@ -0,0 +1,66 @@
+"""Incremental .ipynb reader: decodes the cells of a notebook one at a time instead of the whole file at once"""
+import re, json
+from pathlib import Path
+from typing import Any, Iterator, Tuple
+import nbformat
+from nbformat.v4.rwbase import rejoin_lines, strip_transient
+
+_decoder = json.JSONDecoder(object_hook=nbformat.NotebookNode)
+_re_sep = re.compile(r'[\s,:]*')
+
+class _Reader:
+    "JSON values read off `f` one at a time, holding no more than the current value (and a read chunk) in memory"
+    def __init__(self, f, chunk_size: int):
+        self.f,self.chunk_size,self.buf,self.pos = f,chunk_size,'',0
+
+    def _fill(self) -> bool:
+        # Growing reads keep a huge value linear to read instead of quadratic
+        chunk = self.f.read(max(self.chunk_size, len(self.buf)))
+        self.buf += chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        "Next character that is not whitespace or a separator, '' at the end of the file."
+        while True:
+            self.pos = _re_sep.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf): return self.buf[self.pos]
+            if not self._fill(): return ''
+
+    def take(self, c: str):
+        assert self.peek() == c, f"expected {c!r} at character {self.pos} of the notebook"
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        # Drop what was decoded already, the buffer only ever holds the current value
+        self.buf,self.pos = self.buf[self.pos:],0
+        while True:
+            try: v,end = _decoder.raw_decode(self.buf)
+            except ValueError:
+                # The value goes on past what was read so far, unless the file is over
+                if self._fill(): continue
+                raise
+            # So could a number
+            if end < len(self.buf) or not self._fill(): break
+        self.pos = end
+        return v
+
+def iter_notebook(path: Path, chunk_size: int=1 << 16) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield `('cell', cell)` for each cell of the notebook at `path` as it is read, and `(key, value)` for the
+    other top level keys (`metadata`, `nbformat`, ...). Cells are nbformat nodes with their multiline strings
+    joined, as `nbformat.read` returns them. nbformat writes `cells` before `metadata`.
+    """
+    with open(path, encoding='utf-8') as f:
+        r = _Reader(f, chunk_size)
+        r.take('{')
+        while r.peek() != '}':
+            key = r.value()
+            if key != 'cells':
+                yield key, r.value()
+                continue
+            r.take('[')
+            while r.peek() != ']':
+                nb = nbformat.NotebookNode(cells=[r.value()], metadata={})
+                yield 'cell', strip_transient(rejoin_lines(nb)).cells[0]
+            r.take(']')
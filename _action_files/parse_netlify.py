@@ -1,7 +1,81 @@
-import sys, re
-logs = sys.stdin.read()
+"""
+Reads a deploy or build log from stdin a line at a time, as it is written: sets the `draft_url` output as soon as
+Netlify's Live Draft URL shows up, and reports the slowest pages of a verbose Jekyll build (`jekyll build -V`).
+"""
+import re, sys, time, argparse
+from collections import deque
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
 
-draft_url = re.findall(r'Live Draft URL: .*(https://.*)', logs)[0]
-assert draft_url, 'Was not able to find Draft URL in the logs:\n{}'.format(logs)
-print("::set-output name=draft_url::{}".format(draft_url))
+_re_draft_url = re.compile(r'Live Draft URL: .*(https://.*)')
+# GitHub's downloaded logs start each line with an ISO time, the CI workflow's Jekyll log with seconds since the epoch
+_re_stamp = re.compile(r'^(?:(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)Z?|(\d{9,}\.\d+)) ')
+_re_stage = re.compile(r'^\s*(Rendering|Pre-Render Hooks|Rendering Liquid|Rendering Markup|Post-Convert Hooks|'
+                       r'Rendering Layout): (.+?)\s*$')
 
+def _stamp(line: str) -> Tuple[float, str]:
+    "When `line` was logged and the line without its timestamp, which is now if it has none."
+    m = _re_stamp.match(line)
+    if m is None: return time.monotonic(), line
+    # datetime only parses microseconds, GitHub writes ten millionths
+    return (float(m[2]) if m[2] else datetime.fromisoformat(m[1][:26]).timestamp()), line[m.end():]
+
+class PageTimes:
+    """
+    Render time of each page of a verbose Jekyll build: from its `Rendering:` line to the first line that is not
+    one of its stages, split in markup (markdown to html) and layout when Jekyll logs both. Jekyll renders one
+    page at a time, then writes the site: the last page must not count the writing.
+    """
+    def __init__(self): self.pages,self._page = [],None
+
+    def feed(self, t: float, line: str):
+        m = _re_stage.match(line)
+        if m and m[1] != 'Rendering' and self._page and self._page['path'] == m[2]:
+            self._page[m[1]] = t
+            return
+        self.close(t)
+        if m and m[1] == 'Rendering':
+            self._page = {'path': m[2], 'Rendering': t}
+            self.pages.append(self._page)
+
+    def close(self, t: float):
+        "End the page being rendered at `t`."
+        p,self._page = self._page,None
+        if p is None: return
+        p['time'] = t - p['Rendering']
+        if 'Rendering Layout' in p:
+            p['layout'] = t - p['Rendering Layout']
+            if 'Rendering Markup' in p: p['markup'] = p['Rendering Layout'] - p['Rendering Markup']
+
+    def report(self, top: int=10) -> str:
+        "Table of the `top` slowest pages."
+        pages = sorted(self.pages, key=lambda p: -p['time'])[:top]
+        fmt = lambda p, k: f"{p[k]:7.2f}s" if k in p else ' ' * 8
+        return '\n'.join([f"=== {len(self.pages)} pages rendered in {sum(p['time'] for p in self.pages):.2f}s, "
+                          f"the {len(pages)} slowest ===", f"{'total':>8} {'markup':>8} {'layout':>8}  page"] +
+                         [f"{fmt(p, 'time')} {fmt(p, 'markup')} {fmt(p, 'layout')}  {p['path']}" for p in pages])
+
+def analyze(lines: Iterable[str], times: PageTimes) -> Tuple[Optional[str], list]:
+    "Feed `lines` to `times` and print the draft URL output when it shows up. Return it and the last lines."
+    draft_url,tail,t = None,deque(maxlen=50),time.monotonic()
+    for line in lines:
+        t,line = _stamp(line.rstrip('\r\n'))
+        tail.append(line)
+        m = _re_draft_url.search(line) if draft_url is None else None
+        if m:
+            draft_url = m[1].strip()
+            print("::set-output name=draft_url::{}".format(draft_url), flush=True)
+        times.feed(t, line)
+    times.close(t)
+    return draft_url, list(tail)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jekyll', action='store_true', help="a Jekyll build log, which has no draft URL")
+    parser.add_argument('--top', type=int, default=10, help='number of slowest pages to report')
+    args = parser.parse_args()
+    times = PageTimes()
+    draft_url, tail = analyze(sys.stdin, times)
+    if times.pages: print(times.report(args.top))
+    if not args.jekyll:
+        assert draft_url, 'Was not able to find Draft URL in the logs:\n{}'.format('\n'.join(tail))
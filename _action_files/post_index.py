@@ -0,0 +1,166 @@
+"""
+Reads the front matter of the posts once into an incremental index, and generates the category, tag and archive
+pages and a JSON feed from it, so Liquid renders precomputed lists instead of looping over `site.posts`
+"""
+import re, json, html, hashlib, argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import quote
+from manifest import CACHE_DIR, write_atomic
+from posts import front_matter_text, parse_front_matter, site_config, is_post, post_date, post_url, as_list
+from search_index import DATE_FORMAT
+
+# Jekyll reads this folder because it is in `include` of _config.yml, and only this script writes to it
+PAGES = Path('_generated_pages')
+
+def _slug(s: str) -> str:
+    "As Liquid's `slugify`."
+    return re.sub(r'[\W_]+', '-', s.lower()).strip('-')
+
+def _fields(path: Path, meta: dict) -> dict:
+    "What the generated pages show of the post at `path`."
+    return dict(title=str(meta.get('title', '')), description=str(meta.get('description') or ''),
+                date=post_date(path, meta).isoformat(), url=post_url(path, meta),
+                categories=as_list(meta.get('categories')), tags=as_list(meta.get('tags')),
+                image=str(meta.get('image') or ''), hide=meta.get('hide') is True,
+                published=meta.get('published') is not False)
+
+class PostIndex:
+    """
+    JSON map from the file name of each post to the front matter fields the generated pages need. `update` only
+    parses the front matter that changed since the last run, and never reads the body of a post.
+    """
+    def __init__(self, path: Path=None):
+        self.path = Path(path) if path else None
+        self.entries: Dict[str, dict] = {}
+        if self.path and self.path.exists():
+            try: self.entries = json.loads(self.path.read_text())
+            except ValueError: pass
+
+    def update(self, posts_dir: Path=Path('_posts')) -> int:
+        "Index the posts of `posts_dir`, dropping the ones that are gone, and return how many were (re)parsed."
+        entries,changed = {},0
+        for p in sorted(Path(posts_dir).glob('*')):
+            if not is_post(p): continue
+            text = front_matter_text(p)
+            h = hashlib.sha256(f'{p.name}\0{text}'.encode()).hexdigest()
+            e = self.entries.get(p.name)
+            if e is None or e['hash'] != h:
+                e = dict(hash=h, **_fields(p, parse_front_matter(text)))
+                changed += 1
+            entries[p.name] = e
+        self.entries = entries
+        return changed
+
+    def posts(self) -> List[dict]:
+        "The published posts, newest first as in `site.posts`."
+        return sorted((e for e in self.entries.values() if e['published']), key=lambda e: e['date'], reverse=True)
+
+    def save(self):
+        if self.path is None: return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.path, json.dumps(self.entries, indent=1, sort_keys=True))
+
+def _item(p: dict, base: str, date_format: str) -> str:
+    return (f'<article class="archive-item">\n  <p class="post-meta post-meta-title"><a class="page-meta" '
+            f'href="{base}{p["url"]}">{html.escape(p["title"])}</a>  • '
+            f'{datetime.fromisoformat(p["date"]).strftime(date_format)}</p>\n</article>')
+
+def _page(title: str, permalink: str, body: str) -> str:
+    # Titles are plain text to Liquid, whatever braces they have
+    return (f'---\nlayout: categories\npermalink: {permalink}\ntitle: {json.dumps(title, ensure_ascii=False)}\n'
+            f'search_exclude: true\n---\n{{% raw %}}\n{body}\n{{% endraw %}}\n')
+
+def _group_pages(posts: List[dict], key: str, heading: str, base: str, date_format: str) -> Dict[str, str]:
+    "The overview of the `key` (categories or tags) of `posts`, as `_pages/tags.html` was, and a page for each."
+    groups: Dict[str, List[dict]] = {}
+    for p in posts:
+        for g in p[key]: groups.setdefault(g, []).append(p)
+    if not groups: return {}
+    names = sorted(groups, key=str.lower)
+    url = lambda g: f'/{key}/{quote(_slug(g))}/'
+    overview = [f'<h1>{heading}</h1>\n\n<ul>'] + [f'  <li><a href="#{_slug(g)}">{html.escape(g)}</a></li>' for g in names]
+    overview.append('</ul>')
+    pages = {}
+    for g in names:
+        items = '\n'.join(_item(p, base, date_format) for p in groups[g])
+        overview.append(f'\n<h3 id="{_slug(g)}"><i class="fas fa-tags category-tags-icon"></i> '
+                        f'<a href="{base}{url(g)}">{html.escape(g)}</a></h3>\n{items}')
+        pages[f'{key}/{_slug(g)}.html'] = _page(g, url(g), f'<h1>{html.escape(g)}</h1>\n\n{items}')
+    pages[f'{key}.html'] = _page(heading, f'/{key}/', '\n'.join(overview))
+    return pages
+
+def _pager(n: int, n_pages: int, base: str) -> str:
+    "The pager of `_layouts/home.html` for page `n` of the archive."
+    url = lambda i: f'{base}/archive/' if i == 1 else f'{base}/archive/page{i}/'
+    edge = '  <li><div class="pager-edge">•</div></li>'
+    prev = f'  <li><a href="{url(n - 1)}" class="previous-page">{n - 1}</a></li>' if n > 1 else edge
+    nxt = f'  <li><a href="{url(n + 1)}" class="next-page">{n + 1}</a></li>' if n < n_pages else edge
+    return (f'<div class="pager">\n<ul class="pagination">\n{prev}\n  <li><div class="current-page">{n}</div></li>\n'
+            f'{nxt}\n</ul>\n</div>')
+
+def archive_pages(posts: List[dict], per_page: int, base: str, date_format: str) -> Dict[str, str]:
+    "Posts not hidden from the home page, newest first, `per_page` per page under the year they were published."
+    posts = [p for p in posts if not p['hide']]
+    chunks = [posts[i:i + per_page] for i in range(0, len(posts), per_page)] or [[]]
+    pages = {}
+    for n, chunk in enumerate(chunks, 1):
+        body,year = ['<h1>Arquivo</h1>'],None
+        for p in chunk:
+            if p['date'][:4] != year:
+                year = p['date'][:4]
+                body.append(f'\n<h2>{year}</h2>')
+            body.append(_item(p, base, date_format))
+        if len(chunks) > 1: body.append(_pager(n, len(chunks), base))
+        permalink = '/archive/' if n == 1 else f'/archive/page{n}/'
+        pages['archive.html' if n == 1 else f'archive/page{n}.html'] = _page('Arquivo', permalink, '\n'.join(body))
+    return pages
+
+def json_feed(posts: List[dict], cfg: dict, n_items: int=20) -> dict:
+    "A JSON Feed (jsonfeed.org, version 1.1) of the `n_items` latest posts, without their content."
+    site = cfg.get('url', '') + cfg.get('baseurl', '')
+    items = []
+    for p in [p for p in posts if not p['hide']][:n_items]:
+        item = dict(id=site + p['url'], url=site + p['url'], title=p['title'],
+                    content_text=p['description'] or p['title'], date_published=p['date'] + '+00:00')
+        if p['description']: item['summary'] = p['description']
+        if p['image']: item['image'] = p['image'] if '://' in p['image'] else f"{site}/{p['image'].lstrip('/')}"
+        if p['categories'] + p['tags']: item['tags'] = p['categories'] + p['tags']
+        items.append(item)
+    return dict(version='https://jsonfeed.org/version/1.1', title=cfg.get('title', ''), home_page_url=site + '/',
+                feed_url=site + '/feed.json', description=cfg.get('description', ''), items=items)
+
+def _write(path: Path, text: str) -> bool:
+    "Write `text` to `path` unless it has it already, so Jekyll sees no change, and return whether it did."
+    if path.exists() and path.read_text(encoding='utf-8') == text: return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+    return True
+
+def post_index(posts_dir: Path=Path('_posts'), pages_dir: Path=PAGES, feed: Path=Path('feed.json'), n_items: int=20):
+    "Update the index of the posts in `posts_dir`, then write the pages generated from it to `pages_dir` and `feed`."
+    cfg = site_config()
+    base,date_format = cfg.get('baseurl', ''),(cfg.get('minima') or {}).get('date_format', DATE_FORMAT)
+    index = PostIndex(CACHE_DIR/'posts.json')
+    changed = index.update(posts_dir)
+    posts = index.posts()
+    pages = {**_group_pages(posts, 'categories', 'Categorias', base, date_format),
+             **_group_pages(posts, 'tags', 'Tags', base, date_format),
+             **archive_pages(posts, cfg.get('paginate') or 15, base, date_format)}
+    written = sum(_write(pages_dir/name, text) for name, text in pages.items())
+    for f in [f for f in pages_dir.rglob('*') if f.is_file() and f.relative_to(pages_dir).as_posix() not in pages]:
+        f.unlink()
+    written += _write(feed, json.dumps(json_feed(posts, cfg, n_items), ensure_ascii=False, separators=(',', ':')))
+    index.save()
+    print(f'Indexed {len(posts)} posts ({changed} with new front matter), rewrote {written} of {len(pages) + 1} '
+          f'generated pages')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', default='_posts')
+    parser.add_argument('--dest', default=str(PAGES), help='folder of the generated pages')
+    parser.add_argument('--feed', default='feed.json')
+    parser.add_argument('--feed-items', type=int, default=20, help='latest posts in the JSON feed')
+    args = parser.parse_args()
+    post_index(Path(args.posts), Path(args.dest), Path(args.feed), n_items=args.feed_items)
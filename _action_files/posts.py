@@ -0,0 +1,65 @@
+"""Reading the generated posts in _posts the way Jekyll sees them"""
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Tuple
+from urllib.parse import quote
+import yaml
+from fast_template import _re_blog_date
+
+_re_front_matter = re.compile(r'\A---\s*\n(.*?)\n---\s*\n', re.S)
+
+def parse_front_matter(text: str) -> dict:
+    "The front matter between the `---` lines as a dict."
+    try: return yaml.safe_load(text) or {}
+    except yaml.YAMLError:
+        # fastpages.tpl writes `key: value` lines that are not always valid YAML
+        meta = dict(l.split(':', 1) for l in text.splitlines() if ':' in l)
+        return {k.strip(): v.strip().strip('"\'') for k, v in meta.items()}
+
+def read_post(path: Path) -> Tuple[dict, str]:
+    "Return the front matter of the post at `path` as a dict, and its body."
+    text = Path(path).read_text(encoding='utf-8')
+    m = _re_front_matter.match(text)
+    if not m: return {}, text
+    return parse_front_matter(m.group(1)), text[m.end():]
+
+def front_matter_text(path: Path) -> str:
+    "The front matter of the post at `path` as written, reading no further: posts of notebooks can be huge."
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        if f.readline().rstrip() != '---': return ''
+        for line in f:
+            if line.rstrip() == '---': return ''.join(lines).rstrip('\n')
+            lines.append(line)
+    return ''
+
+def site_config(path: Path=Path('_config.yml')) -> dict:
+    return yaml.safe_load(Path(path).read_text(encoding='utf-8')) if Path(path).exists() else {}
+
+def as_list(v) -> list:
+    "Front matter lists may be YAML lists, comma or space separated strings, or missing."
+    if not v: return []
+    if isinstance(v, str): return [s for s in re.split(r'[,\s]+', v.strip('[] ')) if s]
+    return [str(s) for s in v]
+
+def is_post(path: Path) -> bool:
+    "Jekyll only publishes files in _posts named YYYY-MM-DD-title."
+    return bool(_re_blog_date.match(Path(path).name)) and Path(path).suffix in ('.md', '.markdown', '.html')
+
+def post_date(path: Path, meta: dict) -> datetime:
+    d = meta.get('date')
+    if isinstance(d, datetime): return d
+    if isinstance(d, date): return datetime(d.year, d.month, d.day)
+    return datetime.strptime(_re_blog_date.match(Path(path).name).group(1), '%Y-%m-%d-')
+
+def post_url(path: Path, meta: dict) -> str:
+    """
+    URL of a post relative to the site's baseurl, following Jekyll's default `date` permalink style
+    `/:categories/:year/:month/:day/:title.html` unless the post sets its own `permalink`.
+    """
+    if meta.get('permalink'): return str(meta['permalink'])
+    slug = _re_blog_date.sub('', Path(path).stem, count=1)
+    cats = [c.lower() for c in as_list(meta.get('categories'))]
+    parts = cats + post_date(path, meta).strftime('%Y/%m/%d').split('/') + [f'{slug}.html']
+    return '/' + '/'.join(quote(p) for p in parts)
@@ -0,0 +1,154 @@
+"""nbconvert preprocessors registered on the exporter used by nb2post.py"""
+import base64, hashlib, os
+from pathlib import Path
+from nbconvert.preprocessors import Preprocessor
+from traitlets import Int, Unicode
+
+# Outputs measured by `OutputBudget` in this process, drained by nb2post.py for its report
+budget_report = []
+
+class ExtractImages(Preprocessor):
+    """
+    Decode image outputs straight to content-addressed files in `dest` and point the rendered `<img>` at `url`.
+
+    Files are named after the hash of their bytes, so an identical plot in several posts or across reruns
+    is stored once. The base64 payload is dropped from the notebook, keeping it out of the generated post.
+    """
+    dest = Unicode('images/copied_from_nb/outputs', help='directory the images are written to').tag(config=True)
+    url = Unicode('/images/copied_from_nb/outputs/', help='URL prefix of `dest` on the site').tag(config=True)
+    mimes = {'image/png': '.png', 'image/jpeg': '.jpg'}
+
+    def save(self, raw: bytes, ext: str) -> str:
+        "Write `raw` under its content hash unless already present and return the file name."
+        name = hashlib.sha256(raw).hexdigest()[:20] + ext
+        path = Path(self.dest)/name
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f'.{name}.{os.getpid()}')
+            tmp.write_bytes(raw)
+            tmp.replace(path)
+        return name
+
+    def preprocess_cell(self, cell, resources, index):
+        for out in cell.get('outputs', []):
+            data = out.get('data', {})
+            for mime, ext in self.mimes.items():
+                if not data.get(mime): continue
+                payload = ''.join(data[mime]) if isinstance(data[mime], list) else data[mime]
+                name = self.save(base64.b64decode(payload), ext)
+                # basic.tpl renders `output.metadata.filenames[mime]` as the src instead of a data URI
+                out.setdefault('metadata', {}).setdefault('filenames', {})[mime] = self.url + name
+                data[mime] = ''
+        return cell, resources
+
+def _text(v) -> str: return ''.join(v) if isinstance(v, list) else v
+
+def _terminal(text: str) -> str:
+    "What a terminal shows of `text`: progress bars redrawn with carriage returns and backspaces keep their last state."
+    lines = []
+    for line in text.split('\n'):
+        line = line.rstrip('\r').rsplit('\r', 1)[-1]
+        if '\x08' in line:
+            chars = []
+            for c in line:
+                if c != '\x08': chars.append(c)
+                elif chars: chars.pop()
+            line = ''.join(chars)
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _truncate(text: str, limit: int) -> str:
+    "Keep the first and last lines of `text` fitting in about `limit` bytes, noting what was dropped."
+    if len(text.encode()) <= limit: return text
+    lines = text.split('\n')
+    head, tail, size = [], [], 0
+    while lines and size + len(lines[0].encode()) + 1 <= limit * 2 // 3:
+        size += len(lines[0].encode()) + 1
+        head.append(lines.pop(0))
+    while lines and size + len(lines[-1].encode()) + 1 <= limit:
+        size += len(lines[-1].encode()) + 1
+        tail.insert(0, lines.pop())
+    dropped = '\n'.join(lines)
+    # A single huge line has no line boundary to cut at
+    if not head and not tail: return text.encode()[:limit].decode(errors='ignore') + f'\n... [{len(text.encode()) - limit:,} bytes truncated] ...'
+    return '\n'.join(head + [f'... [{len(lines):,} lines, {len(dropped.encode()):,} bytes truncated] ...'] + tail)
+
+class OutputBudget(Preprocessor):
+    """
+    Truncate outputs so a cell stays under `cell_limit` bytes and the post under `post_limit` bytes.
+
+    Streams first lose the progress bar redraws a terminal would overwrite, then their middle lines. Rich
+    outputs (e.g. a DataFrame's html) fall back to their `text/plain` version. The `output_budget` metadata
+    of a cell, or of the notebook for the post limit, overrides the limit in bytes; `false` disables it.
+    Cells with `hide_output` are not rendered and do not count.
+
+    When nb2post streams a notebook it hands the cells over one at a time and sets `stream` to where the post
+    is at: the index of the cell and the bytes of output so far. The heaviest outputs of a post are not known
+    until its end, so once over the post limit every later output is cut down instead.
+    """
+    cell_limit = Int(100_000, help='bytes of output per cell').tag(config=True)
+    post_limit = Int(1_000_000, help='bytes of output per post').tag(config=True)
+    min_bytes = Int(2_000, help='what outputs are cut down to when the post is over its limit').tag(config=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = None
+
+    def size(self, out) -> int:
+        if out.get('output_type') == 'stream': return len(_text(out.get('text', '')).encode())
+        if out.get('output_type') == 'error': return sum(len(l.encode()) for l in out.get('traceback', []))
+        return sum(len(_text(v).encode()) for v in out.get('data', {}).values() if isinstance(v, (str, list)))
+
+    def shrink(self, out, limit: int):
+        "Cut `out` down to about `limit` bytes."
+        if out.get('output_type') == 'stream':
+            out['text'] = _truncate(_terminal(_text(out.get('text', ''))), limit)
+        elif out.get('output_type') == 'error':
+            out['traceback'] = _truncate('\n'.join(out.get('traceback', [])), limit).split('\n')
+        elif 'data' in out:
+            data = out['data']
+            if 'text/plain' in data:
+                for mime in [m for m in data if m != 'text/plain' and not m.startswith('image/')]: del data[mime]
+                data['text/plain'] = _truncate(_text(data['text/plain']), limit)
+            else:
+                for mime in [m for m in data if not m.startswith('image/')]:
+                    data[mime] = f'<pre>... [{len(_text(data[mime]).encode()):,} bytes of {mime} output hidden] ...</pre>'
+                    if mime != 'text/html': data['text/html'] = data.pop(mime)
+
+    def preprocess(self, nb, resources):
+        post_limit = nb.metadata.get('output_budget', self.post_limit)
+        name = resources.get('nb_path') or resources.get('metadata', {}).get('name', '')
+        entries = []
+        for index, cell in enumerate(nb.cells):
+            if cell.cell_type != 'code' or cell.metadata.get('hide_output'): continue
+            limit = cell.metadata.get('output_budget', self.cell_limit)
+            before = sum(self.size(o) for o in cell.outputs)
+            if limit is not False and before > limit:
+                for out in cell.outputs: self.shrink(out, max(limit // len(cell.outputs), 1))
+            entries.append(dict(cell=index, outputs=cell.outputs, exempt=limit is False, bytes=before))
+        if self.stream is not None:
+            for e in entries:
+                e['cell'] = self.stream['cell']
+                for out in e['outputs']:
+                    over = post_limit is not False and not e['exempt'] and self.stream['bytes'] > post_limit
+                    if over and self.size(out) > self.min_bytes: self.shrink(out, self.min_bytes)
+                    self.stream['bytes'] += self.size(out)
+        # Over the post limit, cut down the heaviest outputs first
+        elif post_limit is not False:
+            outs = [(self.size(o), o) for e in entries if not e['exempt'] for o in e['outputs']]
+            total = sum(self.size(o) for e in entries for o in e['outputs'])
+            for size, out in sorted(outs, key=lambda so: -so[0]):
+                if total <= post_limit or size <= self.min_bytes: break
+                self.shrink(out, self.min_bytes)
+                total -= size - self.size(out)
+        for e in entries:
+            kept = sum(self.size(o) for o in e['outputs'])
+            if e['bytes']: budget_report.append(dict(notebook=name, cell=e['cell'], bytes=e['bytes'], kept=kept))
+        return nb, resources
+
+def print_heaviest(report: list, top: int=10):
+    "Print the `top` cells with the most output and how much of it `OutputBudget` kept."
+    rows = sorted(report, key=lambda r: -r['bytes'])[:top]
+    if not rows: return
+    print(f'\nheaviest cell outputs\n{"notebook":<50} {"cell":>5} {"KB":>8} {"kept KB":>8}')
+    for r in rows: print(f"{Path(r['notebook']).name[:50]:<50} {r['cell']:>5} {r['bytes']/1024:>8.1f} {r['kept']/1024:>8.1f}")
@@ -0,0 +1,107 @@
+"""Opt-in wall time and peak memory instrumentation for the conversion scripts"""
+import json, os, sys, time, threading, tracemalloc, resource, functools
+from contextlib import contextmanager
+from pathlib import Path
+from manifest import write_atomic
+
+# Path of the JSON report, instrumentation is a no-op unless this is set
+REPORT = os.environ.get('FASTPAGES_PROFILE')
+
+class Profiler:
+    """
+    Records the wall time and peak traced memory of nested stages, per file.
+
+    Memory is measured with `tracemalloc`, so it counts Python allocations above what was in use when the
+    stage started. Stages running concurrently in threads share one peak, their memory is approximate.
+    Records are kept per thread: build.py runs nb2post and word2post at once, each saving its own.
+    """
+    def __init__(self, enabled: bool=bool(REPORT)):
+        self.enabled,self._local,self._lock = enabled,threading.local(),threading.Lock()
+
+    @property
+    def records(self) -> list:
+        # A forked worker starts without the records of the thread it was forked from
+        if getattr(self._local, 'pid', None) != os.getpid(): self.records = []
+        return self._local.records
+
+    @records.setter
+    def records(self, records: list): self._local.records,self._local.pid = records,os.getpid()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'): self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str, file=None):
+        "Time the body of the `with` block as stage `name` of `file`, which defaults to the enclosing stage's."
+        if not self.enabled:
+            yield
+            return
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+        stack = self._stack
+        # Keep the peak reached so far by the enclosing stage before restarting the peak for this one
+        if stack: stack[-1]['peak'] = max(stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+        if hasattr(tracemalloc, 'reset_peak'): tracemalloc.reset_peak()
+        if file is None and stack: file = stack[-1]['file']
+        frame = dict(peak=0, base=tracemalloc.get_traced_memory()[0], file=file)
+        stack.append(frame)
+        start = time.perf_counter()
+        try: yield
+        finally:
+            wall = time.perf_counter() - start
+            stack.pop()
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            if stack: stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            self.records.append(dict(stage=name, file=os.path.relpath(file) if file is not None else None, depth=len(stack),
+                                     wall_s=round(wall, 6), peak_mb=round((peak - frame['base']) / 2**20, 3),
+                                     pid=os.getpid()))
+
+    def timed(self, name: str):
+        "Decorator recording each call as stage `name` of the file passed as first argument."
+        def _inner(f):
+            @functools.wraps(f)
+            def _f(file, *args, **kwargs):
+                with self.stage(name, file): return f(file, *args, **kwargs)
+            return _f
+        return _inner
+
+    def drain(self) -> list:
+        "Hand over and forget the records, e.g. to send them from a worker process to its parent."
+        records, self.records = self.records, []
+        return records
+
+    def save(self, script: str, path=REPORT, top: int=10):
+        "Merge the records of `script` into the JSON report at `path` and print the slowest files."
+        if not (self.enabled and path): return
+        path = Path(path)
+        # Another thread of the same build may be merging its script's records
+        with self._lock:
+            try: report = json.loads(path.read_text()) if path.exists() else {}
+            except ValueError: report = {}
+            # Keep what other scripts of the same build recorded, replace our previous run
+            records = [r for r in report.get('records', []) if r.get('script') != script]
+            records += [dict(r, script=script) for r in self.records]
+            div = 2**20 if sys.platform == 'darwin' else 2**10
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / div
+            scripts = dict(report.get('scripts', {}), **{script: dict(max_rss_mb=round(max_rss, 1))})
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, json.dumps(dict(scripts=scripts, records=records), indent=1))
+        print_summary(self.records, top=top, title=f'{script}: slowest files')
+
+def print_summary(records: list, top: int=10, title: str='slowest files'):
+    "Print the `top` files by time spent in their outermost stages, with the breakdown of their inner stages."
+    files = {}
+    for r in records:
+        if r['file'] is None: continue
+        f = files.setdefault(r['file'], dict(wall_s=0., peak_mb=0., stages={}))
+        if r['depth'] == 0: f['wall_s'] += r['wall_s']
+        f['peak_mb'] = max(f['peak_mb'], r['peak_mb'])
+        f['stages'][r['stage']] = f['stages'].get(r['stage'], 0.) + r['wall_s']
+    if not files: return
+    print(f'\n{title}\n{"file":<50} {"wall s":>8} {"peak MB":>8}  stages')
+    for name, f in sorted(files.items(), key=lambda kv: -kv[1]['wall_s'])[:top]:
+        stages = ', '.join(f'{k} {v:.2f}s' for k, v in sorted(f['stages'].items(), key=lambda kv: -kv[1]))
+        print(f'{Path(name).name[:50]:<50} {f["wall_s"]:>8.2f} {f["peak_mb"]:>8.1f}  {stages}')
+
+profiler = Profiler()
@@ -0,0 +1,127 @@
+"""Builds the lunr search index loaded by assets/js/search.js ahead of the Jekyll build, sharded by term prefix"""
+import re, json, hashlib, argparse
+from html.parser import HTMLParser
+from itertools import count
+from pathlib import Path
+from manifest import write_atomic
+from posts import read_post, site_config, is_post, post_date, post_url
+
+DATE_FORMAT = '%b %-d, %Y'
+_re_liquid = re.compile(r'{%-?\s*(raw|endraw)\s*-?%}|{%.*?%}|{{.*?}}', re.S)
+_re_md_link = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+_re_md_noise = re.compile(r'```\w*|^\s{0,3}#{1,6}\s|^\s*[-*+>]\s|^-{3,}\s*$|[*_`|]', re.M)
+
+class _Text(HTMLParser):
+    "Collect the visible text of an html fragment, marking block ends with ' . ' as the Liquid version did."
+    blocks = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'tr', 'hr', 'li', 'td', 'div', 'pre'}
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts,self._skip = [],0
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'): self._skip += 1
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'): self._skip = max(0, self._skip - 1)
+        elif tag in self.blocks: self.parts.append(' . ')
+    def handle_data(self, data):
+        if not self._skip: self.parts.append(data)
+
+def plain_text(body: str) -> str:
+    "Searchable text of a post body made of markdown, html and Liquid."
+    body = _re_md_noise.sub(' ', _re_md_link.sub(r'\1', _re_liquid.sub(' ', body)))
+    parser = _Text()
+    parser.feed(body)
+    parser.close()
+    text = ' '.join(''.join(parser.parts).replace('Table of contents', ' ').split())
+    return re.sub(r'(\s*\.\s+){2,}', ' . ', text).replace('\\', ' ').strip(' .')
+
+def collect(posts_dir: Path=Path('_posts'), pages_dir: Path=Path('_pages')) -> list:
+    "Search documents for every published post, newest first, followed by the pages."
+    cfg = site_config()
+    base = cfg.get('url', '') + cfg.get('baseurl', '')
+    posts = []
+    for p in posts_dir.glob('*'):
+        if not is_post(p): continue
+        meta, body = read_post(p)
+        if meta.get('search_exclude') is True or meta.get('published') is False: continue
+        posts.append((post_date(p, meta), p.name, meta, body, post_url(p, meta)))
+    docs = [dict(title=str(meta.get('title', '')), content=plain_text(body), relUrl=url, url=base + url,
+                 date=f' • {d.strftime(DATE_FORMAT)}') for d, _, meta, body, url in sorted(posts, reverse=True)]
+    for p in sorted(pages_dir.glob('*')) if pages_dir.exists() else []:
+        meta, body = read_post(p)
+        if not meta or meta.get('search_exclude') is True or not meta.get('permalink'): continue
+        docs.append(dict(title=str(meta.get('title', '')), content=plain_text(body), relUrl=meta['permalink'],
+                         url=base + meta['permalink'], date=''))
+    return docs
+
+def _prefix(term: str) -> str:
+    "Shard of `term`: the code point of its first character in hex, as search.js computes it for the typed tokens."
+    return f'{ord(term[0]):x}'
+
+def build_index(docs: dict) -> dict:
+    "Serialized lunr index over `docs`, a map from ref to search document."
+    from lunr import lunr, get_default_builder
+    builder = get_default_builder()
+    builder.metadata_whitelist = ['position']
+    # search.js also splits on '/', replacing it keeps the token positions in `content` valid
+    index = lunr(ref='id', fields=[dict(field_name='title', boost=200), dict(field_name='content', boost=2), 'url'],
+                 documents=[dict(id=i, title=d['title'], content=d['content'].replace('/', ' '),
+                                 url=d['url'].replace('/', ' ')) for i, d in docs.items()], builder=builder)
+    return index.serialize()
+
+def _renumber(index: dict, numbers: dict):
+    """
+    Give each term of the serialized lunr `index` the `_index` it has in `numbers`, the next free one if it's new, so
+    a shard only changes when the postings of its terms do.
+    """
+    free = count(max((numbers[t] for t, _ in index['invertedIndex'] if t in numbers), default=-1) + 1)
+    old = {}
+    for t, posting in index['invertedIndex']:
+        n = numbers[t] if t in numbers else next(free)
+        old[posting['_index']],posting['_index'] = n,n
+    # lunr.Vector needs its elements ordered by term index
+    for _, v in index['fieldVectors']:
+        v[:] = [x for pair in sorted((old[v[i]], v[i + 1]) for i in range(0, len(v), 2)) for x in pair]
+
+def _numbers(dest: Path) -> dict:
+    "The term numbering of the shards already in `dest`."
+    numbers = {}
+    for f in dest.glob('terms-*.json'):
+        try: numbers.update({t: posting['_index'] for t, posting in json.loads(f.read_text(encoding='utf-8'))})
+        except ValueError: pass
+    return numbers
+
+def _write(path: Path, data) -> bool:
+    "Write `data` as JSON to `path`, unless it's there already, and return whether it was."
+    text = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    if path.exists() and path.read_text(encoding='utf-8') == text: return False
+    write_atomic(path, text)
+    return True
+
+def search_index(dest: Path=Path('assets/js/search'), snippet_chars: int=1000):
+    """
+    Write the lunr index of the site to `dest`, split so a query only downloads what it needs: `docs.json` holds the
+    document vectors and previews every query scores with, and `terms-<hex>.json` the postings of the terms starting
+    with character `<hex>`, listed in `index.json`. Only the files whose contents changed are written, so re-indexing
+    after a post is saved rewrites the shards of the terms of that post.
+    """
+    # Refs that don't depend on the position of a post in the site keep the postings of the other posts as they were
+    docs = {hashlib.sha1(d['relUrl'].encode()).hexdigest()[:10]: d for d in collect()}
+    dest.mkdir(parents=True, exist_ok=True)
+    index = build_index(docs)
+    _renumber(index, _numbers(dest))
+    shards = {}
+    for t, posting in index.pop('invertedIndex'): shards.setdefault(_prefix(t), []).append([t, posting])
+    written = sum(_write(dest/f'terms-{k}.json', terms) for k, terms in shards.items())
+    for old in dest.glob('terms-*.json'):
+        if old.stem[len('terms-'):] not in shards: old.unlink()
+    written += _write(dest/'docs.json', dict(index=index, docs={i: dict(d, content=d['content'][:snippet_chars])
+                                                                 for i, d in docs.items()}))
+    _write(dest/'index.json', dict(shards=sorted(shards), count=len(docs)))
+    print(f'Indexed {len(docs)} documents into {len(shards)} search shards in {dest}, {written} of them updated')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dest', default='assets/js/search')
+    parser.add_argument('--snippet-chars', type=int, default=1000, help='characters of content kept for previews')
+    args = parser.parse_args()
+    search_index(Path(args.dest), snippet_chars=args.snippet_chars)
@@ -0,0 +1,5 @@
+"Lets the tests import the action's scripts, which import each other by name as they do in /fastpages"
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
@@ -0,0 +1,58 @@
+"Asset references of notebooks and orphan collection of asset_index.py"
+import json
+from asset_index import AssetIndex, referenced_assets
+
+def _write(root, name, text='x'):
+    p = root/name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text)
+    return p
+
+def _notebook(root, name, markdown):
+    cells = [dict(cell_type='markdown', metadata={}, source=markdown.splitlines(True))]
+    return _write(root, name, json.dumps(dict(cells=cells, metadata={}, nbformat=4, nbformat_minor=4)))
+
+def test_referenced_assets(tmp_path):
+    _write(tmp_path, '_notebooks/post/chart.png')
+    _write(tmp_path, 'images/logo.png')
+    nb = _notebook(tmp_path, '_notebooks/2020-01-01-post.ipynb',
+                   '![chart](post/chart.png?raw=true)\n<img src="{{site.baseurl}}/images/logo.png" width="50%">\n'
+                   '![remote](https://example.com/a.png) ![missing](post/missing.png)')
+    assert [p.as_posix() for p in referenced_assets(nb, tmp_path)] == ['_notebooks/post/chart.png', 'images/logo.png']
+
+def _site(tmp_path):
+    "A site with a live notebook, a deleted one, and files of a managed directory in every state."
+    root = tmp_path
+    nb = _notebook(root, '_notebooks/2020-01-01-live.ipynb', '![](live/chart.png)')
+    produced,referenced = _write(root, '_posts/2020-01-01-live.md'),_write(root, 'images/copied_from_nb/live/chart.png')
+    _write(root, '_posts/2020-01-03-word.md', '![]({{ site.baseurl }}/images/copied_from_nb/mentioned.png)')
+    idx = AssetIndex(root/'cache'/'assets.json', root=root)
+    idx.update(nb, ['images/copied_from_nb/live/chart.png'], [produced])
+    idx.update(root/'_notebooks'/'2020-01-02-gone.ipynb', [],
+               [_write(root, '_posts/2020-01-02-gone.md'), _write(root, 'images/copied_from_nb/gone/out.png')])
+    return idx, dict(produced=produced, referenced=referenced,
+                     mentioned=_write(root, 'images/copied_from_nb/mentioned.png'),
+                     stale=_write(root, 'images/copied_from_nb/stale.png'))
+
+def test_collect_keeps_what_is_referenced_produced_or_mentioned(tmp_path):
+    idx,files = _site(tmp_path)
+    gone = [tmp_path/'_posts/2020-01-02-gone.md', tmp_path/'images/copied_from_nb/gone/out.png']
+    assert idx.collect(dry_run=True) == sorted(gone + [files['stale']])
+    assert all(f.exists() for f in gone)
+    assert idx.collect() == sorted(gone + [files['stale']])
+    assert not any(f.exists() for f in gone + [files['stale']])
+    assert all(files[k].exists() for k in ('produced', 'referenced', 'mentioned'))
+    # The folder of the deleted notebook's outputs went with them, the managed directory itself stays
+    assert not (tmp_path/'images/copied_from_nb/gone').exists() and (tmp_path/'images/copied_from_nb').exists()
+    assert list(AssetIndex(tmp_path/'cache'/'assets.json', root=tmp_path).entries) == ['_notebooks/2020-01-01-live.ipynb']
+
+def test_managed_files_wait_for_every_source_to_be_indexed(tmp_path):
+    idx,files = _site(tmp_path)
+    # Not converted yet: the stale image may well be one of its outputs
+    _notebook(tmp_path, '_notebooks/2020-01-04-new.ipynb', 'text')
+    assert idx.orphans() == [tmp_path/'_posts/2020-01-02-gone.md', tmp_path/'images/copied_from_nb/gone/out.png']
+
+def test_users_of_an_asset(tmp_path):
+    idx,_ = _site(tmp_path)
+    assert idx.users(tmp_path/'images/copied_from_nb/live/chart.png') == ['_notebooks/2020-01-01-live.ipynb']
+    assert idx.users(tmp_path/'images/copied_from_nb/stale.png') == []
@@ -0,0 +1,38 @@
+"Runs build.py on a throwaway workspace with a Word document and a notebook, as the action does"
+import os, sys, json, shutil, subprocess
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).absolute().parents[2]
+
+def _notebook(title: str) -> dict:
+    cells = [dict(cell_type='markdown', metadata={}, source=[f'# {title}\n', '> A test post\n']),
+             dict(cell_type='code', metadata={}, execution_count=1, outputs=[], source=['1 + 1'])]
+    return dict(cells=cells, metadata={}, nbformat=4, nbformat_minor=4)
+
+@pytest.fixture
+def workspace(tmp_path):
+    "A workspace with the action's scripts, one notebook, one Word document and a `pandoc` that needs no Word."
+    ws = tmp_path/'ws'
+    shutil.copytree(ROOT/'_action_files', ws/'_action_files', ignore=shutil.ignore_patterns('__pycache__', 'tests'))
+    for f in ('_config.yml', 'settings.ini'): shutil.copy(ROOT/f, ws)
+    for d in ('_posts', '_notebooks', '_word'): (ws/d).mkdir()
+    (ws/'_notebooks'/'2020-01-01-test.ipynb').write_text(json.dumps(_notebook('Notebook')))
+    (ws/'_word'/'2020-01-02-test.docx').write_bytes(b'x')
+    bin_ = tmp_path/'bin'
+    bin_.mkdir()
+    (bin_/'pandoc').write_text('#!/bin/sh\necho "# Word document"\n')
+    (bin_/'pandoc').chmod(0o755)
+    return ws, bin_
+
+def test_build_with_word_documents(workspace, tmp_path):
+    # nbdev is what the notebook pipeline imports in the parent while the Word pipeline submits to the pool
+    pytest.importorskip('nbdev')
+    ws, bin_ = workspace
+    env = dict(os.environ, PATH=f"{bin_}{os.pathsep}{os.environ['PATH']}", FASTPAGES_CACHE_DIR=str(tmp_path/'cache'))
+    # A worker forked while a thread holds an import lock never starts: that's a timeout, not a failure
+    res = subprocess.run([sys.executable, str(ws/'_action_files'/'build.py'), '--workers', '2'], cwd=ws, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='utf-8', timeout=120)
+    assert res.returncode == 0, res.stdout
+    assert (ws/'_posts'/'2020-01-02-test.md').read_text().rstrip().endswith('# Word document')
+    assert (ws/'_posts'/'2020-01-01-test.md').exists(), res.stdout
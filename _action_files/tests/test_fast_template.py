@@ -0,0 +1,50 @@
+"Post names of the PostRegistry shared by nb2post.py and word2post.py"
+import os
+import pytest
+import fast_template
+from fast_template import PostRegistry
+
+# Noon, UTC, of the first days of 1971: the same dates in every timezone
+_day = lambda n: 86400 * (365 + n) + 43200
+
+def _source(root, name):
+    p = root/name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_bytes(b'x')
+    return p
+
+def test_names_of_the_site(tmp_path):
+    for name in ('_notebooks/2020-01-01-nb.ipynb', '_notebooks/_draft.ipynb', '_word/2020-01-02-doc.docx'):
+        _source(tmp_path, name)
+    names = PostRegistry().register_site(tmp_path)
+    assert sorted(names.values()) == ['2020-01-01-nb.md', '2020-01-02-doc.md']
+
+def test_two_sources_of_the_same_post_collide(tmp_path):
+    nb,doc = _source(tmp_path, '_notebooks/2020-01-01-post.ipynb'),_source(tmp_path, '_word/2020-01-01-post.docx')
+    registry = PostRegistry()
+    assert registry.name(nb) == '2020-01-01-post.md'
+    assert registry.name(nb) == '2020-01-01-post.md'
+    with pytest.raises(AssertionError, match='would both be published'): registry.name(doc)
+
+def test_reuses_names_while_the_modification_time_is_the_same(tmp_path, monkeypatch):
+    nb = _source(tmp_path, '_notebooks/undated post.ipynb')
+    os.utime(nb, (_day(0), _day(0)))
+    registry = PostRegistry(tmp_path/'names.json')
+    name = registry.name(nb)
+    assert name == '1970-12-31-undated-post.md'
+    registry.save()
+
+    def _renamed(*args): raise AssertionError('renamed again')
+    monkeypatch.setattr(fast_template, 'rename_for_jekyll', _renamed)
+    warnings = set()
+    assert PostRegistry(tmp_path/'names.json').name(nb, warnings) == name
+    # The warning about the missing date is repeated for a cached name
+    assert warnings == {(nb, name)}
+    monkeypatch.undo()
+
+    registry = PostRegistry(tmp_path/'names.json')
+    os.utime(nb, (_day(1), _day(1)))
+    assert registry.name(nb) == '1971-01-01-undated-post.md'
+    # The new name releases the old one
+    os.utime(nb, (_day(0), _day(0)))
+    assert registry.name(nb) == name
@@ -0,0 +1,53 @@
+"Freshness, restoring and pruning of the content-hash manifests of manifest.py"
+from manifest import Manifest, file_hash
+
+def _converted(tmp_path, name='post', text='converted'):
+    src,out = tmp_path/f'{name}.ipynb',tmp_path/'_posts'/f'{name}.md'
+    src.write_text(f'{name} source')
+    out.parent.mkdir(exist_ok=True)
+    out.write_text(text)
+    return src, out
+
+def test_fresh_until_the_source_or_an_output_changes(tmp_path):
+    src,out = _converted(tmp_path)
+    m = Manifest('stage', cache_dir=tmp_path/'cache')
+    assert not m.is_fresh(src)
+    m.record(src, [out])
+    assert m.is_fresh(src)
+    out.write_text('edited by hand')
+    assert not m.is_fresh(src)
+    m.record(src, [out])
+    src.write_text('new source')
+    assert not m.is_fresh(src)
+
+def test_entries_survive_a_save_unless_the_dependencies_change(tmp_path):
+    src,out = _converted(tmp_path)
+    m = Manifest('stage', deps_hash='tpl1', cache_dir=tmp_path/'cache')
+    m.record(src, [out], extra='kept')
+    m.save()
+    again = Manifest('stage', deps_hash='tpl1', cache_dir=tmp_path/'cache')
+    assert again.is_fresh(src) and again.entries[str(src)]['extra'] == 'kept'
+    assert not Manifest('stage', deps_hash='tpl2', cache_dir=tmp_path/'cache').is_fresh(src)
+
+def test_restores_missing_outputs_from_the_stored_blobs(tmp_path):
+    src,out = _converted(tmp_path)
+    m = Manifest('stage', cache_dir=tmp_path/'cache', store=True)
+    m.record(src, [out])
+    m.save()
+    out.unlink()
+    # As in a fresh checkout of the repository, with the cache restored
+    assert Manifest('stage', cache_dir=tmp_path/'cache', store=True).is_fresh(src)
+    assert out.read_text() == 'converted'
+    out.unlink()
+    assert not Manifest('stage', cache_dir=tmp_path/'cache').is_fresh(src)
+    assert not out.exists()
+
+def test_prune_drops_removed_sources_and_save_their_blobs(tmp_path):
+    (a,a_out),(b,b_out) = _converted(tmp_path, 'a', 'post a'),_converted(tmp_path, 'b', 'post b')
+    m = Manifest('stage', cache_dir=tmp_path/'cache', store=True)
+    m.record(a, [a_out])
+    m.record(b, [b_out])
+    assert m.prune([a]) == [str(b)]
+    assert m.outputs(b) == [] and m.outputs(a) == [str(a_out)]
+    m.save()
+    assert {p.name for p in m.blobs.iterdir()} == {file_hash(a_out)}
@@ -0,0 +1,34 @@
+"The cell at a time notebook reader of nbstream.py reads what nbformat.read does"
+import nbformat
+import pytest
+from nbstream import iter_notebook
+
+@pytest.fixture
+def notebook(tmp_path):
+    kernelspec = dict(name='python3', display_name='Python 3', language='python')
+    nb = nbformat.v4.new_notebook(metadata=dict(kernelspec=kernelspec, title='é ✓'))
+    code = nbformat.v4.new_code_cell('print("a")\nx = [1, 2]', execution_count=1, outputs=[
+        nbformat.v4.new_output('stream', name='stdout', text='a\n' * 5000),
+        nbformat.v4.new_output('display_data', data={'image/png': 'iVBOR' * 3000, 'text/plain': '<Figure>'},
+                               metadata=dict(needs_background='light'))])
+    code.metadata['tags'] = ['hide']
+    nb.cells = [nbformat.v4.new_markdown_cell('# Title\n> description\n\n{"json": [1]}'), code,
+                nbformat.v4.new_raw_cell(''), nbformat.v4.new_code_cell('')]
+    path = tmp_path/'nb.ipynb'
+    nbformat.write(nb, str(path))
+    return path
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_reads_as_nbformat(notebook, chunk_size):
+    expected = nbformat.read(str(notebook), as_version=4)
+    items = list(iter_notebook(notebook, chunk_size=chunk_size))
+    assert [v for k, v in items if k == 'cell'] == expected.cells
+    rest = {k: v for k, v in items if k != 'cell'}
+    assert rest == dict(metadata=expected.metadata, nbformat=expected.nbformat, nbformat_minor=expected.nbformat_minor)
+    # Cells come as they are read, before the metadata written after them
+    assert [k for k, _ in items][-3:] == ['metadata', 'nbformat', 'nbformat_minor']
+    assert items[1][1].outputs[0].text == 'a\n' * 5000
+
+def test_truncated_notebook(notebook):
+    notebook.write_text(notebook.read_text()[:-200])
+    with pytest.raises(ValueError): list(iter_notebook(notebook, chunk_size=64))
@@ -0,0 +1,65 @@
+"The incremental post index of post_index.py and the pages and feed generated from it"
+import json
+import post_index
+from post_index import PostIndex, archive_pages, json_feed
+
+def _post(posts, name, front_matter, body='Body'):
+    posts.mkdir(exist_ok=True)
+    (posts/name).write_text(f'---\n{front_matter}\n---\n{body}\n', encoding='utf-8')
+
+def test_update_only_parses_changed_front_matter(tmp_path):
+    posts = tmp_path/'_posts'
+    _post(posts, '2020-01-01-a.md', 'title: A\ncategories: [ml]')
+    _post(posts, '2020-02-01-b.md', 'title: B\npublished: false')
+    _post(posts, 'README.md', 'title: not a post')
+    idx = PostIndex(tmp_path/'posts.json')
+    assert idx.update(posts) == 2
+    idx.save()
+    idx = PostIndex(tmp_path/'posts.json')
+    _post(posts, '2020-01-01-a.md', 'title: A\ncategories: [ml]', body='A much longer body')
+    assert idx.update(posts) == 0
+    _post(posts, '2020-02-01-b.md', 'title: B')
+    assert idx.update(posts) == 1
+    assert [p['title'] for p in idx.posts()] == ['B', 'A']
+    assert idx.posts()[1]['url'] == '/ml/2020/01/01/a.html'
+    (posts/'2020-01-01-a.md').unlink()
+    assert idx.update(posts) == 0 and [p['title'] for p in idx.posts()] == ['B']
+
+def _entry(day, **kw):
+    return dict(dict(title=f'Post {day}', description='', date=f'2020-01-{day:02d}T00:00:00', url=f'/p{day}.html',
+                     categories=[], tags=[], image='', hide=False, published=True), **kw)
+
+def test_archive_pages():
+    posts = [_entry(3), _entry(2, hide=True), _entry(1)]
+    pages = archive_pages(posts, per_page=1, base='/blog', date_format='%b %-d, %Y')
+    assert list(pages) == ['archive.html', 'archive/page2.html']
+    assert 'Post 3' in pages['archive.html'] and 'Post 2' not in ''.join(pages.values())
+    assert 'permalink: /archive/page2/' in pages['archive/page2.html']
+    assert 'href="/blog/archive/page2/" class="next-page"' in pages['archive.html']
+    assert archive_pages([], 15, '', '%b %-d, %Y')['archive.html'].count('archive-item') == 0
+
+def test_json_feed():
+    posts = [_entry(2, description='About', image='images/a.png', tags=['x']), _entry(1, hide=True)]
+    feed = json_feed(posts, dict(url='https://example.com', baseurl='/blog', title='Blog'))
+    assert feed['feed_url'] == 'https://example.com/blog/feed.json'
+    assert feed['items'] == [dict(id='https://example.com/blog/p2.html', url='https://example.com/blog/p2.html',
+                                  title='Post 2', content_text='About', summary='About',
+                                  date_published='2020-01-02T00:00:00+00:00',
+                                  image='https://example.com/blog/images/a.png', tags=['x'])]
+
+def test_post_index_rewrites_only_what_changed(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(post_index, 'CACHE_DIR', tmp_path/'cache')
+    (tmp_path/'_config.yml').write_text('baseurl: /blog\npaginate: 15\n')
+    _post(tmp_path/'_posts', '2020-01-01-a.md', 'title: A\ntags: [python, ml]')
+    pages = tmp_path/'_generated_pages'
+    pages.mkdir()
+    (pages/'tags'/'gone.html').parent.mkdir()
+    (pages/'tags'/'gone.html').write_text('a tag no post has anymore')
+    post_index.post_index(pages_dir=pages, feed=tmp_path/'feed.json')
+    assert sorted(p.relative_to(pages).as_posix() for p in pages.rglob('*.html')) == [
+        'archive.html', 'tags.html', 'tags/ml.html', 'tags/python.html']
+    assert json.loads((tmp_path/'feed.json').read_text())['items'][0]['title'] == 'A'
+    capsys.readouterr()
+    post_index.post_index(pages_dir=pages, feed=tmp_path/'feed.json')
+    assert 'rewrote 0 of 5 generated pages' in capsys.readouterr().out
@@ -0,0 +1,90 @@
+"""Long-running watcher that converts only the notebook or Word document that changed"""
+import os, time, threading, argparse
+from pathlib import Path
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+# Import the conversion stack once, every save afterwards reuses it
+import nb2post, word2post, post_index, search_index
+
+class _Debouncer(FileSystemEventHandler):
+    "Collect paths from filesystem events, remembering when each was first seen in the current burst."
+    def __init__(self, suffixes):
+        self.suffixes,self.pending,self.lock = suffixes,{},threading.Lock()
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type == 'deleted': return
+        path = Path(getattr(event, 'dest_path', '') or event.src_path)
+        if path.suffix not in self.suffixes or path.name.startswith(('_', '~$', '.')): return
+        if '.ipynb_checkpoints' in path.parts: return
+        with self.lock:
+            first,_ = self.pending.get(path, (time.monotonic(), None))
+            self.pending[path] = (first, time.monotonic())
+
+    def settled(self, quiet: float):
+        "Pop the paths that saw no event for `quiet` seconds, with the time of their first event."
+        now = time.monotonic()
+        with self.lock:
+            ready = {p: first for p, (first, last) in self.pending.items() if now - last >= quiet}
+            for p in ready: del self.pending[p]
+        return ready
+
+def convert(path: Path, workspace: Path, front_matter: str) -> bool:
+    if path.suffix == '.ipynb': return nb2post.convert(path)
+    try: word2post.convert_docx(path, workspace, front_matter)
+    except Exception as e:
+        print(e)
+        return False
+    return True
+
+def reindex():
+    """
+    What build.py writes from every post once the conversions are done: search shards, post pages and feed.json. Only
+    the search shards of the terms of the posts that changed are rewritten.
+    """
+    search_index.search_index()
+    post_index.post_index()
+
+def watch(workspace: Path, quiet: float=0.2, poll: float=0.05, initial: bool=True):
+    """
+    Convert everything that is out of date once, unless not `initial` because another process does, then convert
+    each changed source as soon as its saves settle.
+    """
+    if initial:
+        nb2post.nb2post(incremental=True)
+        word2post.word2post(workspace)
+        reindex()
+    front_matter = (workspace/'_action_files'/'word_front_matter.txt').read_text(encoding='utf-8')
+    handler = _Debouncer({'.ipynb', '.docx'})
+    observer = Observer()
+    for d in ('_notebooks', '_word'):
+        if (workspace/d).exists(): observer.schedule(handler, str(workspace/d), recursive=True)
+    observer.start()
+    print(f'=== Watching {workspace}/_notebooks and {workspace}/_word ===')
+    try:
+        while True:
+            converted = False
+            for path, first in handler.settled(quiet).items():
+                if not path.exists(): continue
+                start = time.monotonic()
+                ok = convert(path.relative_to(workspace), workspace, front_matter)
+                end = time.monotonic()
+                print(f"{'converted' if ok else 'FAILED'}: {path.name} in {end - start:.2f}s "
+                      f'({end - first:.2f}s since first save)')
+                converted |= ok
+            if converted: reindex()
+            time.sleep(poll)
+    except KeyboardInterrupt: pass
+    finally:
+        observer.stop()
+        observer.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workspace', default=os.environ.get('GITHUB_WORKSPACE', '.'))
+    parser.add_argument('--quiet', type=float, default=0.2, help='seconds without events before a file is converted')
+    parser.add_argument('--no-initial', action='store_true',
+                        help='only convert what changes, another process converts the rest (the converter service)')
+    args = parser.parse_args()
+    workspace = Path(args.workspace).absolute()
+    os.chdir(workspace)
+    watch(workspace, quiet=args.quiet, initial=not args.no_initial)
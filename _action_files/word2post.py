@@ -1,8 +1,69 @@
-import sys
+"""Converts Word documents to Jekyll compliant blog posts"""
+import sys, os, argparse, subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from fast_template import rename_for_jekyll
+from fast_template import rename_for_jekyll, registry
+from asset_index import AssetIndex, index
+from profiling import profiler
+
+@profiler.timed('convert')
+def convert_docx(docx: Path, workspace: Path, front_matter: str) -> Path:
+    "Convert `docx` with pandoc and write it to `_posts` with `front_matter` prepended, in a single write."
+    new_name = registry.name(docx)
+    assert new_name, f'Unable To Rename: {docx} to a Jekyll complaint filename for blog posts'
+    print(f'Converting: {docx.name}  ---to--- {new_name}')
+    # markdown goes to stdout, media assets are saved in assets/img/<filename>/media
+    with profiler.stage('pandoc'):
+        md = subprocess.run(['pandoc', '--from', 'docx', '--to', 'gfm', '--columns', '9999',
+                             f'--extract-media=assets/img/{Path(new_name).stem}', '--standalone', str(docx)],
+                            cwd=workspace, check=True, stdout=subprocess.PIPE, encoding='utf-8').stdout
+    # Inject correction to image links in markdown
+    with profiler.stage('rewrite'):
+        md = front_matter + md.replace('![](assets', '![]({{ site.url }}{{ site.baseurl }}/assets')
+    post = workspace/'_posts'/new_name
+    with profiler.stage('write'): post.write_text(md, encoding='utf-8')
+    return post
+
+def _convert_worker(docx: Path, workspace: Path, front_matter: str):
+    # Timings recorded in a pool process travel back to the parent with the result
+    return convert_docx(docx, workspace, front_matter), profiler.drain()
+
+def word2post(workspace: Path, n_workers: int=None, executor=None) -> bool:
+    """
+    Convert every `_word/*.docx` in `workspace`, running up to `n_workers` pandoc processes at once, or on
+    `executor` when one is shared with other conversions. Return whether all of them converted.
+    """
+    docs = sorted((workspace/'_word').glob('*.docx'))
+    # fail before converting anything if a notebook and a Word document would overwrite each other
+    registry.register_site(workspace)
+    front_matter = (workspace/'_action_files'/'word_front_matter.txt').read_text(encoding='utf-8')
+    (workspace/'_posts').mkdir(exist_ok=True)
+    ex = executor or ThreadPoolExecutor(n_workers or os.cpu_count())
+    task = _convert_worker if isinstance(ex, ProcessPoolExecutor) else lambda *args: (convert_docx(*args), [])
+    futs = [ex.submit(task, d, workspace, front_matter) for d in docs]
+    idx = index if workspace.samefile('.') else AssetIndex(index.path and workspace/index.path, root=workspace)
+    failed = []
+    for docx, fut in zip(docs, futs):
+        try: post, records = fut.result()
+        except Exception as e:
+            print(f'{docx.name}: {e}')
+            failed.append(docx)
+            continue
+        profiler.records += records
+        media = workspace/'assets'/'img'/post.stem
+        idx.update(docx, [], [post, *(f for f in media.rglob('*') if f.is_file())])
+    if executor is None: ex.shutdown()
+    registry.save()
+    idx.save()
+    if failed: print("Conversion failed on the following:\n" + '\n'.join(d.name for d in failed))
+    profiler.save('word2post')
+    return not failed
 
 if __name__ == '__main__':
-    file_path = Path(sys.argv[1])
-    new_name = rename_for_jekyll(file_path)
-    print(new_name)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('file', nargs='?', help='only print the Jekyll compliant name for this file')
+    parser.add_argument('--workspace', default=os.environ.get('GITHUB_WORKSPACE', '.'))
+    parser.add_argument('--workers', type=int, default=None, help='concurrent pandoc processes, one per core by default')
+    args = parser.parse_args()
+    if args.file: print(rename_for_jekyll(Path(args.file)))
+    else: sys.exit(0 if word2post(Path(args.workspace).absolute(), n_workers=args.workers) else 1)
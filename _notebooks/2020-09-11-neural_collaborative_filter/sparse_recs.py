@@ -0,0 +1,176 @@
+"""
+Sparse training data and chunked top-K evaluation for the NCF and LightFM models of the
+posts
+"""
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+def binarize(interactions: sparse.spmatrix) -> sparse.csr_matrix:
+    """Make the ratings binary without densifying the matrix.
+    :param interactions: user x item ratings, e.g. `fetch_movielens()["train"]`"""
+    m = sparse.csr_matrix(interactions, copy=True)
+    m.data = (m.data > 0).astype("int8")
+    m.eliminate_zeros()
+    m.sort_indices()
+    return m
+
+
+def _keys(m: sparse.csr_matrix) -> np.ndarray:
+    "Sorted `user * n_items + item` of the non zero cells of `m`, for `searchsorted`."
+    coo = m.tocoo()
+    return np.sort(coo.row.astype(np.int64) * m.shape[1] + coo.col)
+
+
+def _contains(
+    keys: np.ndarray, users: np.ndarray, items: np.ndarray, n_items: int
+) -> np.ndarray:
+    q = users.astype(np.int64) * n_items + items
+    pos = np.minimum(np.searchsorted(keys, q), len(keys) - 1)
+    return keys[pos] == q if len(keys) else np.zeros(q.shape, dtype=bool)
+
+
+def sample_negatives(
+    interactions: sparse.csr_matrix,
+    n_neg: int = 4,
+    seed: int = 42,
+    max_rounds: int = 10,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sample `n_neg` items without interaction for each interaction of each user.
+    :param interactions: binary user x item matrix
+    :param n_neg: negatives per positive interaction
+    :param seed: random seed
+    :param max_rounds: resample the draws that hit a positive at most this many times,
+        dropping the rest
+    :return: users and items of the negative samples"""
+    rng = np.random.default_rng(seed)
+    n_items = interactions.shape[1]
+    keys = _keys(interactions)
+    users = np.repeat(interactions.tocoo().row, n_neg)
+    items = rng.integers(0, n_items, users.size)
+    for _ in range(max_rounds):
+        hit = _contains(keys, users, items, n_items)
+        if not hit.any():
+            break
+        items[hit] = rng.integers(0, n_items, hit.sum())
+    keep = ~_contains(keys, users, items, n_items)
+    return users[keep], items[keep]
+
+
+def make_tf_dataset(
+    interactions: sparse.spmatrix,
+    n_neg: int = 4,
+    val_split: float = 0.1,
+    batch_size: int = 512,
+    seed: int = 42,
+):
+    """Make TensorFlow datasets from the positive cells of a sparse matrix, plus sampled
+    negatives.
+    :param interactions: binary user x item matrix
+    :param n_neg: negatives sampled per positive interaction, instead of every zero cell
+    :param val_split: fraction of the data that should be used for validation
+    :param batch_size: batch size for training
+    :param seed: random seed for sampling and shuffling the data
+    :return: training and validation datasets, with the inputs and target of
+        `create_ncf`"""
+    import tensorflow as tf
+
+    m = binarize(interactions).tocoo()
+    neg_users, neg_items = sample_negatives(m.tocsr(), n_neg, seed)
+    users = np.concatenate([m.row, neg_users]).astype("int32")
+    items = np.concatenate([m.col, neg_items]).astype("int32")
+    labels = np.concatenate([np.ones(m.nnz, "int8"), np.zeros(neg_users.size, "int8")])
+    order = np.random.default_rng(seed).permutation(users.size)
+    ds = tf.data.Dataset.from_tensor_slices(
+        (
+            {"user_id": users[order], "item_id": items[order]},
+            {"interaction": labels[order]},
+        )
+    )
+    n_val = round(users.size * val_split)
+    ds_val = ds.take(n_val).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    ds_train = ds.skip(n_val).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    return ds_train, ds_val
+
+
+def ncf_scorer(
+    model, n_items: int, batch_size: int = 65536
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Score every item for a chunk of users with the Keras NCF model.
+    :param model: model made with `create_ncf`
+    :param n_items: number of items
+    :param batch_size: prediction batch size"""
+    items = np.arange(n_items, dtype="int32")
+
+    def _score(users: np.ndarray) -> np.ndarray:
+        x = {
+            "user_id": np.repeat(users, n_items).astype("int32"),
+            "item_id": np.tile(items, len(users)),
+        }
+        return np.asarray(model.predict(x, batch_size=batch_size, verbose=0)).reshape(
+            len(users), n_items
+        )
+
+    return _score
+
+
+def lightfm_scorer(
+    model, n_items: int, num_threads: int = 1
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Score every item for a chunk of users with a fitted LightFM model.
+    :param model: fitted `LightFM` model
+    :param n_items: number of items
+    :param num_threads: threads used by LightFM to predict"""
+    items = np.arange(n_items, dtype="int32")
+
+    def _score(users: np.ndarray) -> np.ndarray:
+        scores = model.predict(
+            np.repeat(users, n_items).astype("int32"),
+            np.tile(items, len(users)),
+            num_threads=num_threads,
+        )
+        return scores.reshape(len(users), n_items)
+
+    return _score
+
+
+def top_k(
+    score: Callable[[np.ndarray], np.ndarray],
+    n_users: int,
+    k: int = 5,
+    exclude: Optional[sparse.spmatrix] = None,
+    chunk_size: int = 1024,
+) -> np.ndarray:
+    """Top `k` items of every user, best first, scoring `chunk_size` users at a time.
+    :param score: function of an array of users returning their users x items scores
+    :param n_users: number of users
+    :param k: number of recommendations per user
+    :param exclude: interactions that should not be recommended, e.g. the training set
+    :param chunk_size: users scored at once, memory is `chunk_size` x items
+    :return: users x `k` array of item ids"""
+    exclude = sparse.csr_matrix(exclude) if exclude is not None else None
+    top = []
+    for start in range(0, n_users, chunk_size):
+        users = np.arange(start, min(start + chunk_size, n_users))
+        s = np.array(score(users), dtype="float32")
+        if exclude is not None:
+            s[exclude[users].nonzero()] = -np.inf
+        idx = np.argpartition(-s, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(s, idx, axis=1), axis=1)
+        top.append(np.take_along_axis(idx, order, axis=1))
+    return np.vstack(top)
+
+
+def precision_recall_at_k(
+    top: np.ndarray, test: sparse.spmatrix
+) -> Tuple[float, float]:
+    """Precision and recall of the recommendations, over all users as
+    `tf.keras.metrics.Precision(top_k=k)`.
+    :param top: users x k recommended items, as returned by `top_k`
+    :param test: binary user x item matrix of the held out interactions"""
+    test = binarize(test)
+    users = np.repeat(np.arange(top.shape[0]), top.shape[1])
+    hits = _contains(_keys(test), users, top.ravel(), test.shape[1]).sum()
+    return hits / top.size, hits / max(test.nnz, 1)
@@ -0,0 +1,106 @@
+"""
+Blocked fuzzy matching: score candidate pairs in chunked matrices with rapidfuzz,
+streaming the matches
+"""
+from typing import Callable, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+
+_soundex_codes = {
+    c: str(d)
+    for d, letters in enumerate(["aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"])
+    for c in letters
+}
+
+
+def soundex(s: str) -> str:
+    "American Soundex of the letters of `s`, e.g. `robert` and `rupert` are `R163`."
+    letters = [c for c in s.lower() if c in _soundex_codes]
+    if not letters:
+        return ""
+    code, last = letters[0].upper(), _soundex_codes[letters[0]]
+    for c in letters[1:]:
+        d = _soundex_codes[c]
+        if d != "0" and d != last:
+            code += d
+        # h and w do not separate letters with the same code, vowels do
+        if c not in "hw":
+            last = d
+    return (code + "000")[:4]
+
+
+def prefix(n: int = 2) -> Callable[[str], str]:
+    "Blocking key: the first `n` characters, lowercased."
+    return lambda s: s.strip().lower()[:n]
+
+
+def last_token(key: Callable[[str], str]) -> Callable[[str], str]:
+    "Blocking key: `key` of the last word, e.g. `last_token(soundex)` for the surname."
+    return lambda s: key(s.split()[-1]) if s.split() else ""
+
+
+def blocks(values: Sequence[str], key: Callable[[str], Hashable]) -> dict:
+    "Block key -> sorted array of the indices of `values` in it, without empty keys."
+    out = {}
+    for i, v in enumerate(values):
+        k = key(v)
+        if k:
+            out.setdefault(k, []).append(i)
+    return {k: np.array(idx) for k, idx in out.items()}
+
+
+def match(
+    left: Sequence[str],
+    right: Optional[Sequence[str]] = None,
+    keys: List[Callable] = (prefix(2),),
+    scorer: Callable = fuzz.ratio,
+    threshold: float = 90,
+    chunk_size: int = 2048,
+    workers: int = -1,
+    processor: Callable = None,
+) -> Iterator[Tuple[int, int, float]]:
+    """
+    Yield `(i, j, score)` for every pair of `left[i]` and `right[j]` sharing a block of
+    one of `keys` and scoring at least `threshold`. Without `right`, `left` is
+    deduplicated: only pairs with `i < j` are yielded.
+
+    Pairs are scored with rapidfuzz's `cdist` in matrices of at most `chunk_size` x
+    `chunk_size`, on `workers` cores (-1 for all of them), so memory does not depend on
+    the size of the inputs or of the blocks. A pair sharing the blocks of several keys
+    is yielded once.
+    """
+    dedup = right is None
+    right = left if dedup else right
+    for n, key in enumerate(keys):
+        right_blocks = blocks(right, key)
+        for k, li in blocks(left, key).items():
+            ri = right_blocks.get(k)
+            if ri is None:
+                continue
+            for a in range(0, len(li), chunk_size):
+                # Deduplicating, the chunks below the diagonal mirror the ones above it
+                for b in range(a if dedup else 0, len(ri), chunk_size):
+                    lc, rc = li[a : a + chunk_size], ri[b : b + chunk_size]
+                    scores = cdist(
+                        [left[i] for i in lc],
+                        [right[j] for j in rc],
+                        scorer=scorer,
+                        processor=processor,
+                        score_cutoff=threshold,
+                        dtype=np.float32,
+                        workers=workers,
+                    )
+                    mask = scores >= threshold
+                    if dedup:
+                        mask &= lc[:, None] < rc[None, :]
+                    for x, y in zip(*np.nonzero(mask)):
+                        i, j = int(lc[x]), int(rc[y])
+                        # Already yielded with an earlier key
+                        if any(
+                            key_(left[i]) == key_(right[j]) and key_(left[i])
+                            for key_ in keys[:n]
+                        ):
+                            continue
+                        yield i, j, float(scores[x, y])
@@ -0,0 +1,417 @@
+"""
+Reproducible benchmark of the join/filter/groupby query of the post on each dataframe
+engine, on local TPC-H-like data
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).absolute().parent
+CUTOFF = date(1998, 9, 2)
+PRIORITIES = ["1-URGENT", "2-HIGH", "3-MEDIUM", "4-NOT SPECIFIED", "5-LOW"]
+# TPC-H: orders span 1992-01-01 to 1998-08-02, lines still open after this date have
+# status O
+_start, _end, _current = (
+    np.datetime64(d) for d in ("1992-01-01", "1998-08-02", "1995-06-17")
+)
+
+
+def generate(
+    scale: float = 0.1, data_dir: Path = HERE / "data", seed: int = 0
+) -> tuple:
+    """
+    Write `lineitem.parquet` and `orders.parquet` for TPC-H scale factor `scale` (1 is
+    ~6M lines, ~1.5M orders) with the columns and value distributions the query depends
+    on, unless they already exist.
+
+    :return: Paths of the lineitem and orders files
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dest = Path(data_dir) / f"sf{scale:g}-seed{seed}"
+    lineitem, orders = dest / "lineitem.parquet", dest / "orders.parquet"
+    if lineitem.exists() and orders.exists():
+        return lineitem, orders
+    rng = np.random.default_rng(seed)
+    n_orders = int(1_500_000 * scale)
+    orderkey = np.arange(1, n_orders + 1, dtype=np.int64)
+    orderdate = _start + rng.integers(
+        0, (_end - _start).astype(int) + 1, n_orders
+    ).astype("timedelta64[D]")
+    lines = rng.integers(1, 8, n_orders)
+    l_orderkey = np.repeat(orderkey, lines)
+    quantity = rng.integers(1, 51, len(l_orderkey)).astype(np.float64)
+    shipdate = np.repeat(orderdate, lines) + rng.integers(
+        1, 122, len(l_orderkey)
+    ).astype("timedelta64[D]")
+    receiptdate = shipdate + rng.integers(1, 31, len(l_orderkey)).astype(
+        "timedelta64[D]"
+    )
+    returned = rng.choice(np.array(["R", "A"]), len(l_orderkey))
+    dest.mkdir(parents=True, exist_ok=True)
+    # numpy datetime64[D] becomes a parquet DATE, as in the TPC-H files of the post
+    table = pa.table(
+        {
+            "l_orderkey": l_orderkey,
+            "l_quantity": quantity,
+            "l_extendedprice": np.round(
+                quantity * rng.uniform(900, 2100, len(l_orderkey)), 2
+            ),
+            "l_discount": rng.integers(0, 11, len(l_orderkey)) / 100,
+            "l_returnflag": np.where(receiptdate <= _current, returned, "N"),
+            "l_linestatus": np.where(shipdate > _current, "O", "F"),
+            "l_shipdate": shipdate,
+        }
+    )
+    pq.write_table(table, lineitem)
+    table = pa.table(
+        {
+            "o_orderkey": orderkey,
+            "o_orderdate": orderdate,
+            "o_orderpriority": rng.choice(np.array(PRIORITIES), n_orders),
+            "o_totalprice": np.round(rng.uniform(800, 550_000, n_orders), 2),
+        }
+    )
+    pq.write_table(table, orders)
+    return lineitem, orders
+
+
+# Each engine: (setup(lineitem_path, orders_path) -> state,
+#               query(state) -> result with one row per group)
+def _pandas_setup(lineitem, orders):
+    import pandas as pd
+
+    lineitem, orders = pd.read_parquet(lineitem), pd.read_parquet(orders)
+    # pyarrow reads DATE columns as python objects
+    lineitem["l_shipdate"] = pd.to_datetime(lineitem["l_shipdate"])
+    return lineitem, orders
+
+
+_aggs = {
+    "l_extendedprice": ["sum", "min", "max", "mean"],
+    "l_quantity": ["sum", "min", "max", "mean"],
+}
+
+
+def _pandas(state):
+    lineitem, orders = state
+    df = lineitem.merge(orders, left_on="l_orderkey", right_on="o_orderkey")
+    df = df[
+        (df["l_shipdate"] <= str(CUTOFF))
+        & df["o_orderpriority"].isin(("1-URGENT", "2-HIGH"))
+    ]
+    return df.groupby(["l_returnflag", "l_linestatus"]).agg(_aggs)
+
+
+def _dask_setup(lineitem, orders):
+    import dask.dataframe as dd
+
+    lineitem, orders = _pandas_setup(lineitem, orders)
+    return dd.from_pandas(lineitem, npartitions=os.cpu_count()), dd.from_pandas(
+        orders, npartitions=os.cpu_count()
+    )
+
+
+def _dask(state):
+    lineitem, orders = state
+    df = lineitem.merge(orders, left_on="l_orderkey", right_on="o_orderkey")
+    df = df[
+        (df["l_shipdate"] <= str(CUTOFF))
+        & df["o_orderpriority"].isin(("1-URGENT", "2-HIGH"))
+    ]
+    return df.groupby(["l_returnflag", "l_linestatus"]).agg(_aggs).compute()
+
+
+def _polars_setup(lineitem, orders):
+    import polars as pl
+
+    return pl.read_parquet(lineitem), pl.read_parquet(orders)
+
+
+def _polars_query(lineitem, orders):
+    import polars as pl
+
+    df = lineitem.join(orders, left_on="l_orderkey", right_on="o_orderkey").filter(
+        (pl.col("l_shipdate") <= CUTOFF)
+        & pl.col("o_orderpriority").is_in(["1-URGENT", "2-HIGH"])
+    )
+    # `groupby` was renamed to `group_by` in polars 0.19
+    group_by = df.group_by if hasattr(df, "group_by") else df.groupby
+    aggs = [getattr(pl.col(c), a)().alias(f"{a}({c})") for c in _aggs for a in _aggs[c]]
+    return group_by(["l_returnflag", "l_linestatus"]).agg(aggs)
+
+
+def _polars(state):
+    return _polars_query(*state)
+
+
+def _polars_lazy_setup(lineitem, orders):
+    import polars as pl
+
+    return pl.scan_parquet(lineitem), pl.scan_parquet(orders)
+
+
+def _polars_lazy(state):
+    return _polars_query(*state).collect()
+
+
+def _datatable_setup(lineitem, orders):
+    import datatable as dt
+
+    lineitem, orders = _pandas_setup(lineitem, orders)
+    # Days since epoch, datatable has no parquet reader nor comparisons with date
+    # literals
+    lineitem["l_shipdate"] = (
+        lineitem["l_shipdate"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    )
+    lineitem, orders = dt.Frame(lineitem), dt.Frame(orders)
+    orders.names = {"o_orderkey": "l_orderkey"}
+    orders.key = "l_orderkey"
+    return lineitem, orders
+
+
+def _datatable(state):
+    import datatable as dt
+    from datatable import by, f, g, join
+
+    lineitem, orders = state
+    priority = (g.o_orderpriority == "1-URGENT") | (g.o_orderpriority == "2-HIGH")
+    aggs = {f"{a}({c})": getattr(dt, a)(f[c]) for c in _aggs for a in _aggs[c]}
+    cutoff = int(np.datetime64(CUTOFF, "D").astype(np.int64))
+    return lineitem[(f.l_shipdate <= cutoff) & priority, :, join(orders)][
+        :, aggs, by(f.l_returnflag, f.l_linestatus)
+    ]
+
+
+_sql = f"""
+SELECT l_returnflag, l_linestatus,
+       SUM(l_extendedprice), MIN(l_extendedprice),
+       MAX(l_extendedprice), AVG(l_extendedprice),
+       SUM(l_quantity), MIN(l_quantity), MAX(l_quantity), AVG(l_quantity)
+FROM lineitem JOIN orders ON (l_orderkey = o_orderkey)
+WHERE l_shipdate <= DATE '{CUTOFF}' AND o_orderpriority IN ('1-URGENT', '2-HIGH')
+GROUP BY l_returnflag, l_linestatus
+"""
+
+
+def _duckdb_setup(lineitem, orders):
+    import duckdb
+
+    # Query the pandas dataframes as the post does
+    con = duckdb.connect()
+    lineitem, orders = _pandas_setup(lineitem, orders)
+    con.register("lineitem", lineitem)
+    con.register("orders", orders)
+    return con
+
+
+def _duckdb(con):
+    return con.execute(_sql).df()
+
+
+ENGINES = {
+    "pandas": ("pandas", _pandas_setup, _pandas),
+    "dask": ("dask", _dask_setup, _dask),
+    "polars": ("polars", _polars_setup, _polars),
+    "polars (lazy)": ("polars", _polars_lazy_setup, _polars_lazy),
+    "datatable": ("datatable", _datatable_setup, _datatable),
+    "duckdb": ("duckdb", _duckdb_setup, _duckdb),
+}
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (
+        2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    )
+
+
+def run_engine(
+    engine: str, lineitem: Path, orders: Path, repeats: int = 5, warmups: int = 1
+) -> dict:
+    """
+    Time `warmups` + `repeats` runs of the query on `engine`, which must run in a fresh
+    process: the peak RSS covers loading the data and the runs, `setup_rss_mb` loading
+    the data only.
+    """
+    package, setup, query = ENGINES[engine]
+    module = __import__(package)
+    start = time.perf_counter()
+    state = setup(lineitem, orders)
+    setup_s, setup_rss = time.perf_counter() - start, _rss_mb()
+    for _ in range(warmups):
+        query(state)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = query(state)
+        times.append(time.perf_counter() - start)
+    return dict(
+        engine=engine,
+        version=getattr(module, "__version__", None),
+        setup_s=round(setup_s, 4),
+        times_s=[round(t, 4) for t in times],
+        best_s=round(min(times), 4),
+        median_s=round(statistics.median(times), 4),
+        setup_rss_mb=round(setup_rss, 1),
+        peak_rss_mb=round(_rss_mb(), 1),
+        # len() of a datatable Frame is its number of columns
+        groups=result.shape[0],
+    )
+
+
+def benchmark(
+    scale: float = 0.1,
+    engines: list = None,
+    repeats: int = 5,
+    warmups: int = 1,
+    data_dir: Path = HERE / "data",
+    seed: int = 0,
+) -> dict:
+    """
+    Run the query on every installed engine of `engines` (all by default), each in its
+    own process.
+    """
+    # Processes inherit the peak RSS of their parent: generating the data here would
+    # count in every engine's peak
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as ex:
+        lineitem, orders = ex.submit(generate, scale, data_dir, seed).result()
+        rows = dict(
+            lineitem=ex.submit(_n_rows, lineitem).result(),
+            orders=ex.submit(_n_rows, orders).result(),
+        )
+    results = []
+    for engine in engines or list(ENGINES):
+        # Without importing it: this process's peak RSS is also inherited by the engines
+        if importlib.util.find_spec(ENGINES[engine][0]) is None:
+            print(f"skipping {engine}: {ENGINES[engine][0]} is not installed")
+            continue
+        # A fresh process per engine keeps their memory apart and their caches cold
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as ex:
+            r = ex.submit(
+                run_engine, engine, lineitem, orders, repeats, warmups
+            ).result()
+        print(
+            f"sf{scale:g} {engine:<14} best {r['best_s']:.3f}s",
+            f"median {r['median_s']:.3f}s peak RSS {r['peak_rss_mb']:.0f} MB",
+        )
+        results.append(r)
+    return dict(
+        scale=scale,
+        seed=seed,
+        repeats=repeats,
+        warmups=warmups,
+        rows=rows,
+        python=platform.python_version(),
+        machine=platform.machine(),
+        cpus=os.cpu_count(),
+        results=results,
+    )
+
+
+def _n_rows(path: Path) -> int:
+    import pyarrow.parquet as pq
+
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def load(path: Path = HERE / "results.json") -> list:
+    "Benchmark runs saved in `path`."
+    return json.loads(Path(path).read_text())
+
+
+def to_frame(runs: list):
+    "One row per scale factor and engine, as shown in the post."
+    import pandas as pd
+
+    df = pd.DataFrame(
+        [dict(scale=run["scale"], **r) for run in runs for r in run["results"]]
+    )
+    return df[
+        ["scale", "engine", "version", "best_s", "median_s", "setup_s", "peak_rss_mb"]
+    ].sort_values(["scale", "median_s"])
+
+
+def plot(runs: list, ax=None):
+    """
+    Median query time of each engine per scale factor, the error bars span the fastest
+    and slowest repeat.
+    """
+    import matplotlib.pyplot as plt
+
+    df = to_frame(runs)
+    ax = ax or plt.subplots(figsize=(8, 4))[1]
+    scales = sorted(df["scale"].unique())
+    width = 0.8 / len(scales)
+    engines = list(dict.fromkeys(df["engine"]))
+    for i, scale in enumerate(scales):
+        rows = df[df["scale"] == scale].set_index("engine").reindex(engines)
+        times = {
+            r["engine"]: r["times_s"]
+            for run in runs
+            if run["scale"] == scale
+            for r in run["results"]
+        }
+        err = [
+            [m - min(times.get(e, [m])) for e, m in rows["median_s"].items()],
+            [max(times.get(e, [m])) - m for e, m in rows["median_s"].items()],
+        ]
+        ax.barh(
+            np.arange(len(engines)) + i * width,
+            rows["median_s"],
+            width,
+            xerr=err,
+            label=f"SF {scale:g}",
+        )
+    ax.set_yticks(np.arange(len(engines)) + width * (len(scales) - 1) / 2)
+    ax.set_yticklabels(engines)
+    ax.set_xlabel("segundos")
+    ax.legend()
+    return ax
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        nargs="+",
+        default=[0.1],
+        help="TPC-H scale factors to run",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=list(ENGINES),
+        default=None,
+        help="all installed by default",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--data-dir",
+        default=str(HERE / "data"),
+        help="where the generated parquet files are kept",
+    )
+    parser.add_argument("--output", default=str(HERE / "results.json"))
+    args = parser.parse_args()
+    runs = [
+        benchmark(
+            s, args.engines, args.repeats, args.warmups, Path(args.data_dir), args.seed
+        )
+        for s in args.scale
+    ]
+    Path(args.output).write_text(json.dumps(runs, indent=1))
@@ -16,6 +16,9 @@ from typing import Callable, Tuple
 # Use -n <number> to skip ahead to the n'th animation of a scene.
 # Use -r <number> to specify a resolution (for example, -r 1080
 # for a 1920x1080 video)
+#
+# To render all the scenes of this file in parallel, run:
+# python render.py grad_desc.py
 
 # Resources:
 # https://github.com/Elteoremadebeethoven/AnimationsWithManim
@@ -23,6 +26,63 @@ from typing import Callable, Tuple
 # https://stackoverflow.com/questions/tagged/manim
 # https://www.youtube.com/playlist?list=PL2B6OzTsMUrwo4hA3BBfS7ZR34K361Z8F
 
+class TangentStepsMixin:
+    """
+    Vectorized helpers for the scenes that draw tangent lines along the cost function.
+
+    All the numbers a scene needs (points, slopes, tangent boundaries) are computed in one NumPy pass
+    over the x values, the CONFIG lambdas work elementwise on arrays.
+    """
+
+    def get_boundaries(self, inv_func: Callable[[float], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+
+        :param inv_func: Inverse of the (tangent) functions we're graphing, evaluated elementwise
+        :return: The x-values (for y_max and y_min) that we should limit each graph to
+        """
+        x_bound_y_min = inv_func(self.y_min)
+        x_bound_y_max = inv_func(self.y_max)
+
+        x_min_bound = np.maximum(np.minimum(x_bound_y_min, x_bound_y_max), self.x_min)
+        x_max_bound = np.minimum(np.maximum(x_bound_y_min, x_bound_y_max), self.x_max)
+
+        return x_min_bound, x_max_bound
+
+    def get_tangent_data(self, x_values) -> Tuple[np.ndarray, ...]:
+        """
+
+        :param x_values: Points of the cost function to draw tangents at
+        :return: The x values, cost, slope and tangent boundaries at each point
+        """
+        xs = np.asarray(x_values, dtype='float64')
+        ys = self.cost_func(xs)
+        slopes = self.derivative(xs)
+        x_min_bounds, x_max_bounds = self.get_boundaries(self.inverse_tangent_line(xs, ys, slopes))
+        return xs, ys, slopes, x_min_bounds, x_max_bounds
+
+    def get_descent_path(self, x_start: float, alpha: float, n_steps: int) -> np.ndarray:
+        """
+
+        :return: The `n_steps + 1` points visited by gradient descent from `x_start` with learning rate `alpha`
+        """
+        xs = np.empty(n_steps + 1)
+        xs[0] = x_start
+        for i in range(n_steps): xs[i + 1] = xs[i] - alpha * self.derivative(xs[i])
+        return xs
+
+    def get_step_mobjects(self, x, y, m, x_min_bound, x_max_bound, cost_func_graph):
+        # Get the point in the graph and make a dot
+        dot = Dot(self.input_to_graph_point(x, cost_func_graph))
+
+        # Get the vertical line
+        vertical_line = self.get_vertical_line_to_graph(x, cost_func_graph, color=self.line_color)
+
+        # Get the tangent line graph
+        tangent_line = self.tangent_line(x, y, m)
+        tangent_line_graph = self.get_graph(tangent_line, self.line_color, x_min=x_min_bound, x_max=x_max_bound)
+        return dot, vertical_line, tangent_line_graph
+
+
 class CostGraph(GraphScene):
     CONFIG = {
         "x_min": -0.5,
@@ -48,7 +108,7 @@ class CostGraph(GraphScene):
         self.play(ShowCreation(cost_func))
 
 
-class CostDerivativesGraph(GraphScene):
+class CostDerivativesGraph(TangentStepsMixin, GraphScene):
     CONFIG = {
         "x_min": -0.5,
         "x_max": 10,
@@ -70,25 +130,6 @@ class CostDerivativesGraph(GraphScene):
         # "camera_config": {"background_color": WHITE}
     }
 
-    def get_boundaries(self, inv_func: Callable[[float], int]) -> Tuple[float, float]:
-        """
-
-        :param y_min: Lower limit for the y-axis
-        :param y_max: Higher limit for the y-axis
-        :param inv_func: Inverse of the function we're graphing
-        :return: The x-value pairs (for y_max and y_min) that we should limit the graph to
-        """
-        x_bound_y_min = inv_func(self.y_min)
-        x_bound_y_max = inv_func(self.y_max)
-
-        x_min_bound = min(x_bound_y_min, x_bound_y_max)
-        x_max_bound = max(x_bound_y_min, x_bound_y_max)
-
-        if x_min_bound < self.x_min: x_min_bound = self.x_min
-        if x_max_bound > self.x_max: x_max_bound = self.x_max
-
-        return x_min_bound, x_max_bound
-
     def construct(self):
         # This needs to be the first thing
         self.setup_axes(animate=False)
@@ -97,33 +138,18 @@ class CostDerivativesGraph(GraphScene):
         cost_func_graph = self.get_graph(self.cost_func, color=self.cost_func_color, x_min=0.25,
                                          x_max=self.x_max - 0.25)
 
-        # Define x and y values we will iterate over
-        x_values = list(range(2, 10))
-        x_values.remove(5)  # Would be undefined there (slope = zero)
-        x_values = x_values + x_values[-2::-1]  # Reverse list
-
-        y_values = [self.cost_func(x) for x in x_values]
-        # pts = zip(x_values, y_values)
-
-        # Get these points in the graph and make the dots
-        graph_pts = [self.input_to_graph_point(x, cost_func_graph) for x in
-                     x_values]  # Equivalent to self.coords_to_point(x,y)
-        dots = [Dot(graph_pt) for graph_pt in graph_pts]
-
-        # Get the vertical lines from axis to graph
-        vertical_lines = [self.get_vertical_line_to_graph(x, cost_func_graph, color=self.line_color)
-                          for x in x_values]
-
-        # Find the tangents lines
-        # Slopes
-        slopes = [self.derivative(x) for x in x_values]
-        # Define the boundaries for the tangent graph
-        boundaries_x = [self.get_boundaries(self.inverse_tangent_line(x, y, m))
-                        for x, y, m in zip(x_values, y_values, slopes)]
-        # Get the tangent
-        tangent_lines = [self.tangent_line(x, y, m) for x, y, m in zip(x_values, y_values, slopes)]
-        tangent_lines_graph = [self.get_graph(tangent_line, self.line_color, x_min=boundary_x[0], x_max=boundary_x[1])
-                               for tangent_line, boundary_x in zip(tangent_lines, boundaries_x)]
+        # Define x values we will iterate over
+        x_values = np.arange(2, 10)
+        x_values = x_values[x_values != 5]  # Would be undefined there (slope = zero)
+        x_values = np.concatenate([x_values, x_values[-2::-1]])  # Reverse list
+
+        # Costs, slopes and the boundaries for the tangent graphs, all at once
+        x_values, y_values, slopes, x_min_bounds, x_max_bounds = self.get_tangent_data(x_values)
+
+        # Get the dots, vertical lines from axis to graph and the tangent lines
+        dots, vertical_lines, tangent_lines_graph = zip(*[
+            self.get_step_mobjects(x, y, m, x_min_bound, x_max_bound, cost_func_graph)
+            for x, y, m, x_min_bound, x_max_bound in zip(x_values, y_values, slopes, x_min_bounds, x_max_bounds)])
 
         # Text animations
         slopes_text = [TextMobject('$f\'(p)$ = $m$ = ', '{0:.1f}'.format(m)).move_to(5 * RIGHT).scale(1) for m in
@@ -150,7 +176,7 @@ class CostDerivativesGraph(GraphScene):
                 self.wait(0.25)
 
 
-class CostSteps(GraphScene):
+class CostSteps(TangentStepsMixin, GraphScene):
     CONFIG = {
         "x_min": -0.5,
         "x_max": 10,
@@ -168,48 +194,16 @@ class CostSteps(GraphScene):
         "tangent_line": lambda x_o, y_o, m: lambda x: m * (x - x_o) + y_o,
         "inverse_tangent_line": lambda x_o, y_o, m: lambda y: (y - y_o) / m + x_o,
         "line_color": RED,
-        "start_at_animation_number": 1
+        "start_at_animation_number": 1,
+        # Cost function is drawn from graph_margin to x_max - graph_margin
+        "graph_margin": 0.25,
+        # Set hyperparameters
+        "alpha": 4,
+        "n_steps": 4,
+        # Get the starting point
+        "x_start": 6.5,
     }
 
-    def get_boundaries(self, inv_func: Callable[[float], int]) -> Tuple[float, float]:
-        """
-
-        :param y_min: Lower limit for the y-axis
-        :param y_max: Higher limit for the y-axis
-        :param inv_func: Inverse of the function we're graphing
-        :return: The x-value pairs (for y_max and y_min) that we should limit the graph to
-        """
-        x_bound_y_min = inv_func(self.y_min)
-        x_bound_y_max = inv_func(self.y_max)
-
-        x_min_bound = min(x_bound_y_min, x_bound_y_max)
-        x_max_bound = max(x_bound_y_min, x_bound_y_max)
-
-        if x_min_bound < self.x_min: x_min_bound = self.x_min
-        if x_max_bound > self.x_max: x_max_bound = self.x_max
-
-        return x_min_bound, x_max_bound
-
-    def do_every_step(self, x, cost_func_graph):
-        # Calculate the corresponding y value
-        y = self.cost_func(x)
-
-        # Get the point in the graph and make a dot
-        graph_pt = self.input_to_graph_point(x, cost_func_graph)
-        dot = Dot(graph_pt)
-
-        # Get the vertical line
-        vertical_line = self.get_vertical_line_to_graph(x, cost_func_graph, color=self.line_color)
-
-        # Get the tangent line functions and graphs
-        m = self.derivative(x)
-        tangent_line = self.tangent_line(x, y, m)
-        # For graph
-        tangent_line_xbound = self.get_boundaries(self.inverse_tangent_line(x, y, m))
-        tangent_line_graph = self.get_graph(tangent_line, self.line_color, x_min=tangent_line_xbound[0],
-                                            x_max=tangent_line_xbound[1])
-        return dot, vertical_line, m, tangent_line_graph
-
     def generate_derivative_text(self, m):
         return TextMobject('$f\'(p)$', ' = ', '$m$', ' = ', ' {0:.2f}'.format(m)).move_to(4.5 * RIGHT + UP)
 
@@ -218,17 +212,17 @@ class CostSteps(GraphScene):
         self.setup_axes(animate=False)
 
         # Define cost function for graphing
-        cost_func_graph = self.get_graph(self.cost_func, color=self.cost_func_color, x_min=0.25,
-                                         x_max=self.x_max - 0.25)
+        cost_func_graph = self.get_graph(self.cost_func, color=self.cost_func_color, x_min=self.graph_margin,
+                                         x_max=self.x_max - self.graph_margin)
 
-        # Set hyperparameters
-        alpha = 4
-        n_steps = 4
-
-        # Get the starting point
-        x_prev = 6.5
+        # Whole descent path, then slopes and tangent boundaries at each step in one pass
+        x_values = self.get_descent_path(self.x_start, self.alpha, self.n_steps)
+        x_values, y_values, slopes, x_min_bounds, x_max_bounds = self.get_tangent_data(x_values)
+        steps = [self.get_step_mobjects(x, y, m, x_min_bound, x_max_bound, cost_func_graph)
+                 for x, y, m, x_min_bound, x_max_bound in zip(x_values, y_values, slopes, x_min_bounds, x_max_bounds)]
+        derivative_texts = [self.generate_derivative_text(m) for m in slopes[:-1]]
 
-        dot_prev, vertical_line_prev, m_prev, tangent_line_graph_prev = self.do_every_step(x_prev, cost_func_graph)
+        dot_prev, vertical_line_prev, tangent_line_graph_prev = steps[0]
 
         # Text fields
         derivative_text_prev = TextMobject('$f\'(p)$', ' = ', '$m$').move_to(4.5 * RIGHT + UP)
@@ -245,14 +239,13 @@ class CostSteps(GraphScene):
             Write(p_text_prev)
         )
         self.wait(1)
-        for i in range(n_steps):
+        for i in range(self.n_steps):
             # Get next parameters
-            x = x_prev - alpha * m_prev
-            dot, vertical_line, m, tangent_line_graph = self.do_every_step(x, cost_func_graph)
+            dot, vertical_line, tangent_line_graph = steps[i + 1]
 
             # Build transitions
             arrow = Arrow(dot_prev.get_center(), dot.get_center())
-            derivative_text = self.generate_derivative_text(m_prev)
+            derivative_text = derivative_texts[i]
 
             # Turns out we didn't use the examples with number filled in
             # p_text = TextMobject('$p_{t}$', '$\leftarrow$', '{0:.2f}'.format(x_prev), '-', '{0:.2f}'.format(m_prev)).move_to(5 * RIGHT + DOWN)
@@ -290,10 +283,8 @@ class CostSteps(GraphScene):
                 ReplacementTransform(derivative_text[2], p_text_prev[-1])
             )
             # Update values
-            x_prev = x
             dot_prev = dot
             vertical_line_prev = vertical_line
-            m_prev = m
             tangent_line_graph_prev = tangent_line_graph
         self.play(
             FadeOut(dot_prev),
@@ -302,154 +293,15 @@ class CostSteps(GraphScene):
         )
 
 
-class CostLargeSteps(GraphScene):
+class CostLargeSteps(CostSteps):
     CONFIG = {
-        "x_min": -0.5,
-        "x_max": 10,
-        "y_min": -0.5,
-        "y_max": 5,
-        "y_bottom_tick": 0,
-        "x_leftmost_tick": 0,
-        "x_axis_label": "$p$",
-        "y_axis_label": "$f$",
-        "graph_origin": 2.5 * DOWN + 6 * LEFT,
-        "axes_color": WHITE,
         "cost_func": lambda x: (1 / 2) * (x - 5) ** 2 + 1 / 2,
-        "cost_func_color": YELLOW,
         "derivative": lambda x: (x - 5),
-        "tangent_line": lambda x_o, y_o, m: lambda x: m * (x - x_o) + y_o,
-        "inverse_tangent_line": lambda x_o, y_o, m: lambda y: (y - y_o) / m + x_o,
-        "line_color": RED,
-        "start_at_animation_number": 1
+        "graph_margin": 2,
+        "alpha": 2.25,
+        "n_steps": 3,
     }
 
-    def get_boundaries(self, inv_func: Callable[[float], int]) -> Tuple[float, float]:
-        """
-
-        :param y_min: Lower limit for the y-axis
-        :param y_max: Higher limit for the y-axis
-        :param inv_func: Inverse of the function we're graphing
-        :return: The x-value pairs (for y_max and y_min) that we should limit the graph to
-        """
-        x_bound_y_min = inv_func(self.y_min)
-        x_bound_y_max = inv_func(self.y_max)
-
-        x_min_bound = min(x_bound_y_min, x_bound_y_max)
-        x_max_bound = max(x_bound_y_min, x_bound_y_max)
-
-        if x_min_bound < self.x_min: x_min_bound = self.x_min
-        if x_max_bound > self.x_max: x_max_bound = self.x_max
-
-        return x_min_bound, x_max_bound
-
-    def do_every_step(self, x, cost_func_graph):
-        # Calculate the corresponding y value
-        y = self.cost_func(x)
-
-        # Get the point in the graph and make a dot
-        graph_pt = self.input_to_graph_point(x, cost_func_graph)
-        dot = Dot(graph_pt)
-
-        # Get the vertical line
-        vertical_line = self.get_vertical_line_to_graph(x, cost_func_graph, color=self.line_color)
-
-        # Get the tangent line functions and graphs
-        m = self.derivative(x)
-        tangent_line = self.tangent_line(x, y, m)
-        # For graph
-        tangent_line_xbound = self.get_boundaries(self.inverse_tangent_line(x, y, m))
-        tangent_line_graph = self.get_graph(tangent_line, self.line_color, x_min=tangent_line_xbound[0],
-                                            x_max=tangent_line_xbound[1])
-        return dot, vertical_line, m, tangent_line_graph
-
-    def generate_derivative_text(self, m):
-        return TextMobject('$f\'(p)$', ' = ', '$m$', ' = ', ' {0:.2f}'.format(m)).move_to(4.5 * RIGHT + UP)
-
-    def construct(self):
-        # This needs to be the first thing
-        self.setup_axes(animate=False)
-
-        # Define cost function for graphing
-        cost_func_graph = self.get_graph(self.cost_func, color=self.cost_func_color, x_min=2, x_max=self.x_max - 2)
-
-        # Set hyperparameters
-        alpha = 2.25
-        n_steps = 3
-
-        # Get the starting point
-        x_prev = 6.5
-
-        dot_prev, vertical_line_prev, m_prev, tangent_line_graph_prev = self.do_every_step(x_prev, cost_func_graph)
-
-        # Text fields
-        derivative_text_prev = TextMobject('$f\'(p)$', ' = ', '$m$').move_to(4.5 * RIGHT + UP)
-        p_text_prev = TextMobject('$p_{t}$', '$\leftarrow$', '$p_{(t-1)}$', '-', '$m_{(t-1)}$').move_to(
-            4.5 * RIGHT + DOWN)
-
-        # Animations start here
-        self.add(
-            cost_func_graph
-        )
-        self.play(
-            FadeIn(dot_prev),
-            Write(derivative_text_prev),
-            Write(p_text_prev)
-        )
-        self.wait(1)
-        for i in range(n_steps):
-            # Get next parameters
-            x = x_prev - alpha * m_prev
-            dot, vertical_line, m, tangent_line_graph = self.do_every_step(x, cost_func_graph)
-
-            # Build transitions
-            arrow = Arrow(dot_prev.get_center(), dot.get_center())
-            derivative_text = self.generate_derivative_text(m_prev)
-            # p_text = TextMobject('$p_{t}$', '$\leftarrow$', '{0:.2f}'.format(x_prev), '-', '{0:.2f}'.format(m_prev)).move_to(5 * RIGHT + DOWN)
-
-            # For an applied example
-            # if m_prev < 0:
-            #     p_text = TextMobject('$p_{t}$', '$\leftarrow$', '{0:.2f}'.format(x_prev), '-', '({0:.2f})'.format(m_prev)).move_to(5*RIGHT + DOWN)
-            # else:
-            #     p_text = TextMobject('$p_{t}$', '$\leftarrow$', '{0:.2f}'.format(x_prev), '-', '{0:.2f}'.format(m_prev)).move_to(5*RIGHT + DOWN)
-
-            # Animate
-            # Draw tangent line and show derivative
-            self.play(
-                ShowCreation(vertical_line_prev, run_time=0.5),
-                ShowCreation(tangent_line_graph_prev),
-                Transform(derivative_text_prev, derivative_text)
-            )
-            # Growing arrow and populate values
-            self.play(
-                GrowArrow(arrow, run_time=2),
-                ReplacementTransform(derivative_text[2], p_text_prev[-1]),  # Populate the slope value
-                # Transform(p_text_prev, p_text_prev) # Populate the dot values
-            )
-            # Move dot and perform step
-            self.play(
-                ReplacementTransform(dot_prev, dot, run_time=0.5),
-                FadeOut(vertical_line_prev),
-                FadeOut(tangent_line_graph_prev),
-                ReplacementTransform(p_text_prev[2:].copy(), p_text_prev[0])
-            )
-            # Make arrow go away
-            self.play(
-                FadeOut(arrow),
-                ReplacementTransform(dot.copy(), p_text_prev[2]),
-                ReplacementTransform(derivative_text[2], p_text_prev[-1])
-            )
-            # Update values
-            x_prev = x
-            dot_prev = dot
-            vertical_line_prev = vertical_line
-            m_prev = m
-            tangent_line_graph_prev = tangent_line_graph
-        self.play(
-            FadeOut(dot_prev),
-            FadeOut(derivative_text_prev),
-            FadeOut(p_text_prev),
-        )
-
 
 class CostTwoDimensions(ThreeDScene):
     CONFIG = {
@@ -473,9 +325,10 @@ class CostTwoDimensions(ThreeDScene):
         "func_opacity": 0.75
     }
 
-    def get_updated_weights(self, weights: np.array):
-        weights = weights - self.alpha*self.get_gradient_at_point(weights)
-        return weights
+    def get_descent_path(self) -> np.array:
+        # Each step scales the weights by (1 - alpha * gradient), so step t is just that factor to the power t
+        factor = 1 - self.alpha*self.gradient
+        return self.xy_start_point * factor ** np.arange(self.n_steps)[:, np.newaxis]
 
     def get_gradient_at_point(self, weights: np.array):
         return weights*self.gradient
@@ -507,17 +360,16 @@ class CostTwoDimensions(ThreeDScene):
             resolution=1
         ).set_opacity(1)
 
-        # Initialize the weights - remember that the weights are the xy coordinates in the xyz plane
-        xy_values = [self.xy_start_point]
-        # Compute the nexts xy value pairs
-        for i in range(self.n_steps-1): xy_values.append(self.get_updated_weights(xy_values[i]))
+        # Compute all the xy value pairs - remember that the weights are the xy coordinates in the xyz plane
+        xy_values = self.get_descent_path()
 
         # Compute the gradient values for the text
-        gradient_values = [self.get_gradient_at_point(weight) for weight in xy_values]
+        gradient_values = self.get_gradient_at_point(xy_values)
         gradient_text = [self.get_gradient_text(gradient) for gradient in gradient_values]
 
         # Compute the points and arrows that perform the descent
-        points = [Dot(self.cost(x, y), color=self.point_color).scale(1.5) for x,y in xy_values]
+        xyz_values = self.cost(xy_values[:, 0], xy_values[:, 1]).T
+        points = [Dot(xyz, color=self.point_color).scale(1.5) for xyz in xyz_values]
         arrows = [Arrow(points[i], points[i+1], color=self.point_color) for i in range(len(points)-1)]
 
         # Animations
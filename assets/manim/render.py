@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Render every scene of a manim file at once, one manim process per scene, skipping unchanged ones"""
+import ast, os, sys, json, time, hashlib, argparse, subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+HERE = Path(__file__).absolute().parent
+SCENE_BASES = {'Scene', 'GraphScene', 'ThreeDScene', 'MovingCameraScene', 'ZoomedScene'}
+QUALITY_FLAGS = {'l': ['-l'], 'm': ['-m'], 'h': ['--high_quality']}
+QUALITY_DIRS = {'l': '480p15', 'm': '720p30', 'h': '1080p60'}
+# Scenes published as a still image (videos/<file>/images) instead of a gif
+STILLS = {'CostGraph'}
+
+
+def find_scenes(path: Path) -> List[str]:
+    """
+
+    :param path: Python file with manim scenes
+    :return: Names of the classes deriving (directly or not) from a manim scene, in file order
+    """
+    scenes = []
+    for node in ast.parse(path.read_text()).body:
+        if not isinstance(node, ast.ClassDef): continue
+        bases = {b.id for b in node.bases if isinstance(b, ast.Name)}
+        if bases & (SCENE_BASES | set(scenes)): scenes.append(node.name)
+    return scenes
+
+
+def scene_hashes(path: Path, quality: str) -> Dict[str, str]:
+    """
+
+    :return: For each scene, a hash of its class source (CONFIG included), of the classes it inherits from
+    in the same file, of the file's module level code (imports, constants) and of the render settings
+    """
+    src = path.read_text()
+    tree = ast.parse(src)
+    classes = {n.name: n for n in tree.body if isinstance(n, ast.ClassDef)}
+    module_code = ''.join(ast.get_source_segment(src, n) for n in tree.body if not isinstance(n, ast.ClassDef))
+
+    def lineage(name):
+        node = classes[name]
+        bases = [b.id for b in node.bases if isinstance(b, ast.Name) and b.id in classes]
+        return [ast.get_source_segment(src, node)] + [s for b in bases for s in lineage(b)]
+
+    hashes = {}
+    for scene in find_scenes(path):
+        h = hashlib.sha256(json.dumps([quality, scene in STILLS, module_code, lineage(scene)]).encode())
+        hashes[scene] = h.hexdigest()
+    return hashes
+
+
+def scene_output(path: Path, scene: str, quality: str) -> Path:
+    "Where manim writes `scene`, relative to the directory of `path`."
+    if scene in STILLS: return Path('videos')/path.stem/'images'/f'{scene}.png'
+    return Path('videos')/path.stem/QUALITY_DIRS[quality]/f'{scene}.gif'
+
+
+def render_scene(path: Path, scene: str, quality: str = 'l') -> float:
+    """
+
+    :return: Seconds it took manim to render `scene` of `path` into `videos/` next to it
+    """
+    flags = ['-s'] if scene in STILLS else ['-i']
+    cmd = [sys.executable, '-m', 'manim', path.name, scene, *QUALITY_FLAGS[quality], *flags,
+           '--media_dir', '.', '--leave_progress_bars']
+    start = time.monotonic()
+    subprocess.run(cmd, cwd=path.parent, check=True, stdout=subprocess.DEVNULL)
+    return time.monotonic() - start
+
+
+def render_all(path: Path, scenes: List[str] = None, quality: str = 'l', n_workers: int = None,
+               force: bool = False) -> List[str]:
+    """
+    Render `scenes` (all of them by default) whose hash changed since the last render, or whose output is
+    missing. `render_manifest.json` next to `path` records the hash and the asset each scene produced, for
+    every scene that rendered even if others failed.
+
+    :return: Names of the scenes that failed to render
+    """
+    manifest_path = path.parent / 'render_manifest.json'
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    hashes = scene_hashes(path, quality)
+    unknown = [s for s in scenes or [] if s not in hashes]
+    if unknown: raise ValueError(f"{', '.join(unknown)} not in {path.name}, its scenes are: {', '.join(hashes)}")
+    todo = []
+    for scene in scenes or list(hashes):
+        key, output = f'{path.name}:{scene}', scene_output(path, scene, quality)
+        entry = manifest.get(key, {})
+        if not force and entry.get('hash') == hashes[scene] and (path.parent / output).exists():
+            print(f'unchanged {scene}, keeping {output}')
+        else: todo.append(scene)
+    failed = []
+    try:
+        with ThreadPoolExecutor(n_workers or os.cpu_count()) as ex:
+            futs = {ex.submit(render_scene, path, s, quality): s for s in todo}
+            for fut in as_completed(futs):
+                scene, output = futs[fut], scene_output(path, futs[fut], quality)
+                try: seconds = fut.result()
+                except subprocess.CalledProcessError as e:
+                    print(f'FAILED {scene}: manim exited with {e.returncode}')
+                    failed.append(scene)
+                    continue
+                manifest[f'{path.name}:{scene}'] = dict(hash=hashes[scene], quality=quality, output=str(output))
+                print(f'rendered {scene} in {seconds:.1f}s to {output}')
+    finally:
+        # Keep what rendered, even when interrupted: the next run only redoes the rest
+        manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True) + '\n')
+    if failed: print(f"{len(failed)} of {len(todo)} scenes failed: {', '.join(failed)}")
+    return failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('file', nargs='?', default=str(HERE / 'grad_desc.py'))
+    parser.add_argument('scenes', nargs='*', help='scenes to render, all of them by default')
+    parser.add_argument('--quality', choices=list(QUALITY_FLAGS), default='l')
+    parser.add_argument('--workers', type=int, default=None, help='scenes rendered at once, one per core by default')
+    parser.add_argument('--force', action='store_true', help='render even the scenes that did not change')
+    args = parser.parse_args()
+    failed = render_all(Path(args.file).absolute(), args.scenes, quality=args.quality, n_workers=args.workers,
+                        force=args.force)
+    sys.exit(1 if failed else 0)